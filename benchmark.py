@@ -0,0 +1,169 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import program
+from chunk_script import CHUNK_SIZE, generate_chunks
+from profiling import peak_rss
+
+NAMES = ['Программист', 'Python программист', 'Аналитик данных', 'Бизнес-аналитик', 'Менеджер по продажам',
+         'Бухгалтер', 'Водитель', 'Инженер', 'Системный администратор', 'Дизайнер']
+
+STAGES = ['csv_parser', 'aggregation_serial', 'aggregation_columns', 'aggregation_parallel', 'generate_chunks',
+          'generate_excel', 'generate_png']
+
+"""
+этапы, которые читают csv файл; для них считается количество обработанных строк в секунду
+"""
+READING_STAGES = ['csv_parser', 'aggregation_serial', 'aggregation_columns', 'aggregation_parallel',
+                  'generate_chunks']
+
+
+def generate_csv(file_name, rows, years=16, cities=100, currencies=5, seed=0):
+    """Функция создаёт csv файл с синтетическими вакансиями в формате выгрузки hh.ru.
+        При одинаковых параметрах содержимое файла всегда одинаковое
+
+    :param file_name: имя создаваемого файла
+    :param rows: количество вакансий
+    :param years: количество лет публикации, начиная с 2007
+    :param cities: количество городов
+    :param currencies: количество валют из program.currency_to_rub, первая из них RUR
+    :param seed: начальное значение генератора случайных чисел
+    """
+
+    generator = random.Random(seed)
+    city_names = [f'Город {i}' for i in range(cities)]
+    city_weights = [1 / (i + 1) for i in range(cities)]
+    currency_names = ['RUR'] + [key for key in program.currency_to_rub if key != 'RUR'][:currencies - 1]
+    currency_weights = [20] + [1] * (len(currency_names) - 1)
+    with open(file_name, 'w', encoding='utf_8_sig', newline='') as w_file:
+        writer = csv.writer(w_file)
+        writer.writerow(['name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at'])
+        for i in range(rows):
+            salary_from = generator.randrange(10, 300) * 1000
+            writer.writerow([f'{generator.choice(NAMES)} {generator.randrange(50)}', f'{salary_from}.0',
+                             f'{salary_from + generator.randrange(100) * 1000}.0',
+                             generator.choices(currency_names, currency_weights)[0],
+                             generator.choices(city_names, city_weights)[0],
+                             f'{2007 + i * years // rows}-{generator.randrange(1, 13):02d}-'
+                             f'{generator.randrange(1, 29):02d}T12:00:00+0300'])
+
+
+def run_stage(stage, file_name, name, workers, chunk_size, statistics):
+    """Функция выполняет один этап и измеряет его время. Запускается в отдельном процессе,
+        чтобы пиковое потребление памяти относилось только к этому этапу
+
+    :param stage: название этапа из STAGES
+    :param file_name: csv файл с вакансиями
+    :param name: название профессии
+    :param workers: количество процессов для параллельных этапов
+    :param chunk_size: размер диапазона байт для параллельной обработки
+    :param statistics: статистика по годам и городам для этапов построения отчётов
+    :return: кортеж из времени в секундах, пикового потребления памяти процессом этапа
+        и его дочерними процессами в килобайтах
+    """
+
+    directory = os.path.dirname(file_name)
+    start = time.perf_counter()
+    if stage == 'csv_parser':
+        program.сsv_parser(file_name)
+    elif stage == 'aggregation_serial':
+        program.StatisticsAccumulator(name).add_all(program.iter_vacancies(file_name)).statistics()
+    elif stage == 'aggregation_columns':
+        program.VacancyColumns.from_file(file_name, use_cache=False).statistics(name)
+    elif stage == 'aggregation_parallel':
+        program.parallel_file_statistics(file_name, name, workers, chunk_size).statistics()
+    elif stage == 'generate_chunks':
+        generate_chunks(file_name)
+    elif stage == 'generate_excel':
+        program.Report(name).generate_excel(*statistics, os.path.join(directory, 'report.xlsx'))
+    elif stage == 'generate_png':
+        program.Report(name).generate_png(*statistics, os.path.join(directory, 'graph.png'))
+    return time.perf_counter() - start, peak_rss(), peak_rss(children=True)
+
+
+def run_benchmark(rows, years=16, cities=100, currencies=5, seed=0, name='Программист', workers=None,
+                  chunk_size=CHUNK_SIZE, stages=None, repeat=1):
+    """Функция создаёт синтетический файл во временной папке и измеряет время и память каждого этапа.
+        Каждый запуск этапа выполняется в новом процессе, из повторов берётся лучшее время
+
+    :param rows: количество вакансий в синтетическом файле
+    :param years: количество лет публикации
+    :param cities: количество городов
+    :param currencies: количество валют
+    :param seed: начальное значение генератора случайных чисел
+    :param name: название профессии
+    :param workers: количество процессов для параллельных этапов, по умолчанию равно количеству ядер
+    :param chunk_size: размер диапазона байт для параллельной обработки
+    :param stages: список этапов, по умолчанию все этапы из STAGES
+    :param repeat: количество повторов каждого этапа
+    :return: словарь с параметрами запуска и результатами этапов
+    """
+
+    directory = tempfile.mkdtemp()
+    try:
+        file_name = os.path.join(directory, 'vacancies.csv')
+        generate_csv(file_name, rows, years, cities, currencies, seed)
+        statistics = program.StatisticsAccumulator(name).add_all(program.iter_vacancies(file_name)).statistics()
+
+        results = []
+        context = multiprocessing.get_context('spawn')
+        for stage in STAGES if stages is None else stages:
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    runs.append(executor.submit(run_stage, stage, file_name, name, workers, chunk_size,
+                                                statistics).result())
+            seconds = min(run[0] for run in runs)
+            results.append({'stage': stage, 'seconds': round(seconds, 4),
+                            'rows_per_second': round(rows / seconds) if READING_STAGES.__contains__(stage) else None,
+                            'peak_rss_kb': runs[0][1] and max(run[1] for run in runs),
+                            'peak_rss_children_kb': runs[0][2] and max(run[2] for run in runs)})
+
+        return {'rows': rows, 'years': years, 'cities': cities, 'currencies': currencies, 'seed': seed,
+                'file_size': os.path.getsize(file_name), 'workers': workers or os.cpu_count(),
+                'chunk_size': chunk_size, 'python': platform.python_version(), 'platform': platform.platform(),
+                'cpu_count': os.cpu_count(), 'stages': results}
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(argv=None):
+    """Точка входа: запускает замеры и сохраняет результат в json
+
+    :param argv: список аргументов без имени программы, по умолчанию sys.argv[1:]
+    """
+
+    parser = argparse.ArgumentParser(description='Замеры времени и памяти этапов обработки вакансий')
+    parser.add_argument('--rows', type=int, default=100000, help='количество вакансий в синтетическом файле')
+    parser.add_argument('--years', type=int, default=16, help='количество лет публикации')
+    parser.add_argument('--cities', type=int, default=100, help='количество городов')
+    parser.add_argument('--currencies', type=int, default=5, help='количество валют')
+    parser.add_argument('--seed', type=int, default=0, help='начальное значение генератора случайных чисел')
+    parser.add_argument('-w', '--workers', type=int, help='количество процессов для параллельных этапов')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='размер диапазона байт для процесса')
+    parser.add_argument('--stage', action='append', choices=STAGES, help='этап, можно указать несколько раз')
+    parser.add_argument('--repeat', type=int, default=1, help='количество повторов каждого этапа')
+    parser.add_argument('-o', '--output', help='json файл для результатов, по умолчанию вывод в консоль')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    result = run_benchmark(args.rows, args.years, args.cities, args.currencies, args.seed, workers=args.workers,
+                           chunk_size=args.chunk_size, stages=args.stage, repeat=args.repeat)
+    if args.output is None:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as w_file:
+            json.dump(result, w_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,70 @@
+import argparse
+import codecs
+import cProfile
 import csv
+import gzip
+import io
+import mmap
+import os
+import sys
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from profiling import tracer
+
+CHUNK_SIZE = 32 * 1024 * 1024
+READ_BUFFER = 1024 * 1024
+
+
+def compression(file_name):
+    """Функция определяет сжатие файла по первым байтам
+
+    :param file_name: Имя файла
+    :return: 'gzip', 'zstd' или None для несжатого файла
+    """
+
+    with open(file_name, 'rb') as r_file:
+        magic = r_file.read(4)
+    if magic[:2] == b'\x1f\x8b':
+        return 'gzip'
+    if magic == b'\x28\xb5\x2f\xfd':
+        return 'zstd'
+    return None
+
+
+def open_csv(file_name, buffer_size=READ_BUFFER):
+    """Функция открывает csv файл на чтение как текст. Сжатые gzip и zstd файлы распаковываются
+        по ходу чтения, без распаковки на диск. Для zstd нужен пакет zstandard
+
+    :param file_name: Имя csv файла с данными (utf-8, допускается BOM)
+    :param buffer_size: размер буфера чтения в байтах
+    :return: текстовый файловый объект
+    """
+
+    kind = compression(file_name)
+    if kind is None:
+        return open(file_name, encoding='utf_8_sig', buffering=buffer_size)
+    if kind == 'zstd' and zstandard is None:
+        raise ImportError('для чтения файлов zstd нужен пакет zstandard')
+    if kind == 'gzip':
+        stream = io.BufferedReader(gzip.GzipFile(filename=file_name), buffer_size)
+    else:
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+            open(file_name, 'rb', buffering=buffer_size), read_size=buffer_size, closefd=True), buffer_size)
+    return io.TextIOWrapper(stream, encoding='utf_8_sig')
 
 
 def generate_chunks(file_name):
-    with open(file_name, encoding='utf_8_sig') as r_file:
+    """Функция делит csv файл на чанки по годам публикации вакансий: file_YYYY.csv
+
+    :param file_name: Имя csv файла с данными, допускается сжатие gzip и zstd
+    :return: список имён созданных файлов в порядке первого появления года в исходном файле
+    """
+
+    with tracer.stage('generate_chunks'), open_csv(file_name) as r_file:
         file_reader = csv.reader(r_file, delimiter=",")
         list_naming = file_reader.__next__()
         list_of_years = {}
@@ -12,19 +74,144 @@ def generate_chunks(file_name):
                 if list_naming[i] == 'published_at':
                     date_index = i
         else:
-            return
-        for row in file_reader:
+            return []
+        for row in tracer.iterate(file_reader, 'csv_decode'):
             date = row[date_index][:4]
             if list_of_years.__contains__(date):
                 list_of_years[date].append(row)
             else:
                 list_of_years.update({date: [row]})
+        chunk_names = []
         for date in list_of_years.keys():
-            with open(file_name.split('.')[0] + '_' + date + '.csv', 'w', encoding='utf_8_sig') as w_file:
+            chunk_name = file_name.split('.')[0] + '_' + date + '.csv'
+            with open(chunk_name, 'w', encoding='utf_8_sig') as w_file:
                 writer = csv.writer(w_file)
                 writer.writerow(list_naming)
                 for row in list_of_years[date]:
                     writer.writerow(row)
+            chunk_names.append(chunk_name)
+        return chunk_names
+
+
+def count_quotes(r_map, start, end):
+    """Функция считает кавычки в диапазоне байт, читая его блоками
+
+    :param r_map: отображённый в память файл
+    :param start: начало диапазона
+    :param end: конец диапазона
+    :return: количество кавычек
+    """
+
+    return sum(r_map[position:min(position + READ_BUFFER, end)].count(b'"')
+               for position in range(start, end, READ_BUFFER))
+
+
+def record_end(r_map, start, position, size, quoted):
+    """Функция ищет конец записи csv: первый перевод строки не раньше position, который не стоит внутри кавычек.
+        Перевод строки стоит внутри поля в кавычках, если от начала записи start до него нечётное количество
+        кавычек, удвоенные кавычки внутри поля чётность не меняют
+
+    :param r_map: отображённый в память файл
+    :param start: начало записи
+    :param position: смещение, с которого ищется перевод строки
+    :param size: конец области поиска
+    :param quoted: есть ли в файле кавычки, без них каждый перевод строки заканчивает запись
+    :return: смещение после перевода строки или size, если его нет
+    """
+
+    end = r_map.find(b'\n', position, size)
+    if quoted and end != -1:
+        quotes = count_quotes(r_map, start, end)
+        while end != -1 and quotes % 2:
+            previous, end = end, r_map.find(b'\n', end + 1, size)
+            if end != -1:
+                quotes += count_quotes(r_map, previous, end)
+    return size if end == -1 else end + 1
+
+
+def split_file(file_name, chunk_size=CHUNK_SIZE, offset=None, complete_lines=False):
+    """Функция делит csv файл на диапазоны байт, не создавая промежуточных файлов.
+        Границы диапазонов выравниваются по концу записи, заголовок в диапазоны не входит.
+        Если в файле есть кавычки, перевод строки внутри поля в кавычках границей не считается,
+        поэтому диапазоны содержат те же записи, что читает csv.reader
+
+    :param file_name: Имя csv файла с данными (utf-8, допускается BOM)
+    :param chunk_size: примерный размер диапазона в байтах
+    :param offset: смещение начала первого диапазона, по умолчанию сразу после заголовка
+    :param complete_lines: не включать в диапазоны последнюю запись без перевода строки,
+        которая может быть ещё не дописана
+    :return: кортеж (список названий столбцов, список пар (начало, конец) диапазонов)
+    :raises ValueError: если файл сжат
+    """
+
+    if os.path.getsize(file_name) == 0:
+        return [], []
+    if compression(file_name) is not None:
+        raise ValueError(f'сжатый файл {file_name} нельзя разделить на диапазоны байт')
+    with tracer.stage('split_file'), open(file_name, 'rb') as r_file, \
+            mmap.mmap(r_file.fileno(), 0, access=mmap.ACCESS_READ) as r_map:
+        start = len(codecs.BOM_UTF8) if r_map[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+        quoted = r_map.find(b'"', start) != -1
+        header_end = record_end(r_map, start, start, len(r_map), quoted)
+        list_naming = next(csv.reader(io.StringIO(r_map[start:header_end].decode('utf-8'))), [])
+
+        start = header_end if offset is None else offset
+        size = len(r_map)
+        if complete_lines:
+            size = r_map.rfind(b'\n', start) + 1
+            while quoted and size > start and count_quotes(r_map, start, size) % 2:
+                size = r_map.rfind(b'\n', start, size - 1) + 1
+        ranges = []
+        while start < size:
+            end = record_end(r_map, start, start + chunk_size, size, quoted) if start + chunk_size < size else size
+            ranges.append((start, end))
+            start = end
+        return list_naming, ranges
+
+
+def read_range(file_name, start, end):
+    """Генератор строк csv файла из диапазона байт, полученного в split_file.
+        Файл отображается в память, строки декодируются по одной
+
+    :param file_name: Имя csv файла с данными
+    :param start: начало диапазона
+    :param end: конец диапазона
+    :return: строки файла в виде списков значений
+    """
+
+    with open(file_name, 'rb') as r_file, mmap.mmap(r_file.fileno(), 0, access=mmap.ACCESS_READ) as r_map:
+        r_map.seek(start)
+
+        def lines():
+            while r_map.tell() < end:
+                yield r_map.readline().decode('utf-8')
+
+        yield from tracer.iterate(csv.reader(lines(), delimiter=","), 'csv_decode')
+
+
+def main(argv=None):
+    """Точка входа скрипта: делит csv файл на чанки по годам.
+        С --trace замеры этапов сохраняются в json, с --profile работа профилируется cProfile
+
+    :param argv: список аргументов без имени программы, по умолчанию sys.argv[1:]
+    """
+
+    parser = argparse.ArgumentParser(description='Деление csv файла с вакансиями на файлы по годам')
+    parser.add_argument('file', nargs='?', default='vacancies_by_year.csv', help='csv файл с вакансиями')
+    parser.add_argument('--trace', help='json файл для замеров этапов: время, строки, память')
+    parser.add_argument('--profile', help='файл для статистики cProfile (pstats)')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    tracer.reset(args.trace is not None)
+    if args.profile is None:
+        generate_chunks(args.file)
+    else:
+        profiler = cProfile.Profile()
+        profiler.runcall(generate_chunks, args.file)
+        profiler.dump_stats(args.profile)
+    if args.trace is not None:
+        tracer.save(args.trace)
 
 
-generate_chunks('vacancies_by_year.csv')
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from itertools import repeat
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss(children=False):
+    """Функция возвращает пиковое потребление памяти в килобайтах, если его можно узнать
+
+    :param children: вернуть пиковое потребление самого большого из завершённых дочерних процессов
+    :return: килобайты или None
+    """
+
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+class Tracer:
+    """Класс для сбора замеров этапов обработки: время, количество вызовов и элементов,
+        пиковое потребление памяти на момент окончания этапа и счётчики строк.
+        Пока замеры не включены, все методы ничего не делают и не замедляют обработку.
+
+    Время этапа считается без времени вложенных этапов: если этап агрегации читает вакансии,
+    а вакансии строятся из строк csv, то время разбора csv и построения вакансий в агрегацию не входит.
+
+    Attributes:
+        enabled (bool): включены ли замеры
+        stages (dict): {этап: {'seconds', 'calls', 'items', 'peak_rss_kb'}}
+        counters (dict): {счётчик: значение}
+        nested (float): общее время всех закончившихся замеров, используется для вычитания вложенных этапов
+        started (float): время включения замеров
+    """
+
+    def __init__(self):
+        """Инициализирует объект с выключенными замерами
+        """
+
+        self.reset()
+
+    def reset(self, enabled=False):
+        """Сбрасывает накопленные замеры
+
+        :param enabled: включить ли замеры
+        """
+
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.nested = 0.0
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds, calls=0, items=0, rss=None):
+        """Добавляет замер к этапу
+
+        :param stage: название этапа
+        :param seconds: время в секундах
+        :param calls: количество вызовов
+        :param items: количество обработанных элементов
+        :param rss: пиковое потребление памяти в килобайтах
+        """
+
+        if not self.stages.__contains__(stage):
+            self.stages.update({stage: {'seconds': 0.0, 'calls': 0, 'items': 0, 'peak_rss_kb': None}})
+        value = self.stages[stage]
+        value['seconds'] += seconds
+        value['calls'] += calls
+        value['items'] += items
+        if rss is not None:
+            value['peak_rss_kb'] = rss if value['peak_rss_kb'] is None else max(value['peak_rss_kb'], rss)
+
+    def count(self, counter, value):
+        """Увеличивает счётчик, например количество прочитанных или пропущенных строк
+
+        :param counter: название счётчика
+        :param value: прибавляемое значение
+        """
+
+        if self.enabled:
+            self.counters.update({counter: self.counters.get(counter, 0) + value})
+
+    @contextmanager
+    def stage(self, stage):
+        """Контекстный менеджер, замеряющий время блока кода как один вызов этапа
+
+        :param stage: название этапа
+        """
+
+        if not self.enabled:
+            yield
+            return
+        nested, start = self.nested, time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add(stage, elapsed - (self.nested - nested), 1, rss=peak_rss())
+            self.nested = nested + elapsed
+
+    def iterate(self, iterable, stage):
+        """Оборачивает итерируемый объект так, что время получения каждого элемента засчитывается этапу.
+            При выключенных замерах возвращает сам объект
+
+        :param iterable: итерируемый объект, например csv.reader
+        :param stage: название этапа
+        :return: итерируемый объект с теми же элементами
+        """
+
+        return self.timed(iterable, stage) if self.enabled else iterable
+
+    def timed(self, iterable, stage):
+        """Генератор для iterate
+
+        :param iterable: итерируемый объект
+        :param stage: название этапа
+        :return: элементы iterable
+        """
+
+        iterator, seconds, items = iter(iterable), 0.0, 0
+        try:
+            while True:
+                nested, start = self.nested, time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed = time.perf_counter() - start
+                    seconds += elapsed - (self.nested - nested)
+                    self.nested = nested + elapsed
+                items += 1
+                yield item
+        finally:
+            self.add(stage, seconds, 1, items, peak_rss())
+
+    def map(self, executor, function, *iterables):
+        """Аналог executor.map, который собирает замеры из процессов пула и добавляет их к текущим
+
+        :param executor: пул процессов
+        :param function: функция уровня модуля
+        :param iterables: аргументы функции, как в executor.map
+        :return: результаты функции в порядке аргументов
+        """
+
+        if not self.enabled:
+            yield from executor.map(function, *iterables)
+            return
+        for result, snapshot in executor.map(traced_call, repeat(function), *iterables):
+            self.merge(snapshot)
+            yield result
+
+    def snapshot(self):
+        """Возвращает накопленные замеры в виде словаря, пригодного для json
+
+        :return: словарь с этапами, счётчиками, общим временем и пиковым потреблением памяти
+        """
+
+        return {'wall_seconds': time.perf_counter() - self.started, 'peak_rss_kb': peak_rss(),
+                'children_peak_rss_kb': peak_rss(children=True),
+                'stages': {key: dict(value) for key, value in self.stages.items()}, 'counters': dict(self.counters)}
+
+    def merge(self, snapshot):
+        """Добавляет замеры, полученные в другом процессе.
+            Время и счётчики складываются, для памяти берётся максимум
+
+        :param snapshot: словарь из snapshot
+        """
+
+        for stage, value in snapshot['stages'].items():
+            self.add(stage, value['seconds'], value['calls'], value['items'], value['peak_rss_kb'])
+        for counter, value in snapshot['counters'].items():
+            self.count(counter, value)
+
+    def save(self, file_name):
+        """Сохраняет накопленные замеры в json файл
+
+        :param file_name: имя файла
+        """
+
+        with open(file_name, 'w', encoding='utf-8') as w_file:
+            json.dump(self.snapshot(), w_file, ensure_ascii=False, indent=2)
+
+
+def traced_call(function, *args):
+    """Функция выполняет задачу в процессе пула с включёнными замерами, используется в Tracer.map
+
+    :param function: функция уровня модуля
+    :param args: аргументы функции
+    :return: кортеж (результат функции, замеры процесса)
+    """
+
+    tracer.reset(True)
+    result = function(*args)
+    return result, tracer.snapshot()
+
+
+"""
+общий объект замеров процесса, замеры включаются через tracer.reset(True)
+"""
+tracer = Tracer()
@@ -1,19 +1,30 @@
+import argparse
+import base64
+import cProfile
 import csv
+import functools
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from array import array
+from collections import deque
+from contextlib import contextmanager, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-from matplotlib import pyplot as plt
-from jinja2 import Environment, FileSystemLoader
-
-import doctest
-import unittest
-
-from openpyxl import Workbook
-from openpyxl.styles import Font
-from openpyxl.styles.borders import Border, Side
 
 from unittest import TestCase
 
-import pdfkit
+import chunk_script
+from chunk_script import CHUNK_SIZE, READ_BUFFER, compression, open_csv, read_range, split_file
+from profiling import tracer
+from vacancy_cache import cache_dir_for, cached_arrays, pack_strings, read_index, unpack_strings
 
 currency_to_rub = {
     "AZN": 35.68,
@@ -29,6 +40,94 @@ currency_to_rub = {
 }
 
 
+def vacancies_from_rows(list_naming, rows, quarantine=None):
+    """Генератор, превращающий строки csv файла в объекты Vacancy.
+        Номера столбцов определяются по заголовку один раз, объекты создаются через Vacancy.from_fields,
+        а номер месяца публикации вычисляется один раз для каждого месяца.
+        Строки с пустыми значениями, неверным количеством столбцов, валютой не из currency_to_rub
+        или нечисловым окладом и датой пропускаются и записываются в quarantine с причиной:
+        'columns', 'empty', 'currency' или 'value'.
+        При включённых замерах их количество попадает в счётчик dropped_rows
+
+    :param list_naming: список названий столбцов из заголовка файла
+    :param rows: итерируемый объект со строками файла в виде списков значений
+    :param quarantine: csv writer для пропущенных строк, см. quarantine_writer
+    :return: объекты Vacancy в порядке следования строк
+    """
+
+    name, salary_from, salary_to, salary_currency, area_name, published_at = \
+        (list_naming.index(field) for field in ('name', 'salary_from', 'salary_to', 'salary_currency', 'area_name',
+                                                'published_at'))
+    columns_count, from_fields, months = len(list_naming), Vacancy.from_fields, {}
+    rows_count = dropped = 0
+    try:
+        for row in rows:
+            rows_count += 1
+            if len(row) != columns_count or row.__contains__(""):
+                dropped += 1
+                if quarantine is not None:
+                    quarantine.writerow(row + ['columns' if len(row) != columns_count else 'empty'])
+                continue
+            if not currency_to_rub.__contains__(row[salary_currency]):
+                dropped += 1
+                if quarantine is not None:
+                    quarantine.writerow(row + ['currency'])
+                continue
+            try:
+                month = months.get(row[published_at][:7])
+                if month is None:
+                    month = months.setdefault(row[published_at][:7], month_key(row[published_at]))
+                vacancy = from_fields(row[name], row[salary_from], row[salary_to], row[salary_currency],
+                                      row[area_name], month)
+            except ValueError:
+                dropped += 1
+                if quarantine is not None:
+                    quarantine.writerow(row + ['value'])
+                continue
+            yield vacancy
+    finally:
+        tracer.count('rows', rows_count)
+        tracer.count('dropped_rows', dropped)
+
+
+@contextmanager
+def quarantine_writer(file_name, list_naming):
+    """Контекстный менеджер, открывающий csv файл для пропущенных строк.
+        В файл записывается заголовок исходного файла со столбцом reason
+
+    :param file_name: имя файла, при None ничего не открывается и возвращается None
+    :param list_naming: список названий столбцов из заголовка исходного файла
+    :return: csv writer или None
+    """
+
+    if file_name is None:
+        yield None
+        return
+    with open(file_name, 'w', encoding='utf-8', newline='') as w_file:
+        writer = csv.writer(w_file)
+        writer.writerow(list_naming + ['reason'])
+        yield writer
+
+
+def iter_vacancies(file_name, quarantine=None, buffer_size=READ_BUFFER):
+    """Генератор, построчно читающий csv файл и возвращающий объекты Vacancy.
+        Файл не загружается в память целиком, в каждый момент времени хранится только одна строка.
+        Сжатые gzip и zstd файлы распаковываются по ходу чтения, см. chunk_script.open_csv
+
+    :param file_name: Имя csv файла с данными
+    :param quarantine: имя csv файла для пропущенных строк, по умолчанию они не сохраняются
+    :param buffer_size: размер буфера чтения в байтах
+    :return: объекты Vacancy в порядке следования строк в файле
+    """
+
+    with open_csv(file_name, buffer_size) as r_file:
+        file_reader = csv.reader(r_file, delimiter=",")
+        list_naming = file_reader.__next__()
+        with quarantine_writer(quarantine, list_naming) as writer:
+            yield from tracer.iterate(vacancies_from_rows(list_naming, tracer.iterate(file_reader, 'csv_decode'),
+                                                          writer), 'vacancy_build')
+
+
 def сsv_parser(file_name):
     """Функция читает информацию из файла и создает объекты vacancy,
         которые складывает в два словаря:
@@ -41,33 +140,962 @@ def сsv_parser(file_name):
     'RUR'
     """
 
-    with open(file_name, encoding='utf_8_sig') as r_file:
-        file_reader = csv.reader(r_file, delimiter=",")
-        list_naming = file_reader.__next__()
-        vacancies, vacancies_city = {}, {}
-        for row in file_reader:
-            if len(row) != len(list_naming) or row.__contains__(""):
+    vacancies, vacancies_city = {}, {}
+    for vacancy in iter_vacancies(file_name):
+        year = str(vacancy.year)
+        if vacancies_city.keys().__contains__(vacancy.area_name):
+            vacancies_city[vacancy.area_name].append(vacancy)
+        else:
+            vacancies_city.update({vacancy.area_name: [vacancy]})
+        if vacancies.keys().__contains__(year):
+            vacancies[year].append(vacancy)
+        else:
+            vacancies.update({year: [vacancy]})
+
+    return vacancies, vacancies_city
+
+
+def to_rub(salary_by_currency):
+    """Функция переводит суммы окладов, накопленные по валютам, в рубли
+
+    :param salary_by_currency: словарь {валюта: сумма окладов в этой валюте}
+    :return: сумма окладов в рублях
+
+    >>> to_rub({'RUR': 100.0, 'EUR': 10.0})
+    699.0
+    """
+
+    return sum(salary_by_currency[currency] * currency_to_rub[currency] for currency in sorted(salary_by_currency))
+
+
+def merge_salary(salary1, salary2):
+    """Функция добавляет суммы окладов по валютам из второго словаря в первый
+
+    :param salary1: словарь {валюта: сумма окладов}, который будет изменён
+    :param salary2: словарь {валюта: сумма окладов}
+    :return: salary1
+
+    >>> merge_salary({'RUR': 10.0}, {'RUR': 5.0, 'USD': 1.0})
+    {'RUR': 15.0, 'USD': 1.0}
+    """
+
+    for currency in salary2:
+        salary1[currency] = salary1.get(currency, 0) + salary2[currency]
+    return salary1
+
+
+def month_key(published_at):
+    """Функция переводит дату публикации в номер месяца: год * 12 + месяц - 1
+
+    :param published_at: дата публикации вида 'YYYY-MM-...'
+    :return: номер месяца
+
+    >>> month_key('2007-12-03T17:34:36+0300'), month_key('2007-12-03T17:34:36+0300') // 12
+    (24095, 2007)
+    """
+
+    return int(published_at[:4]) * 12 + int(published_at[5:7]) - 1
+
+
+def period_label(key, period):
+    """Функция возвращает подпись периода по его номеру
+
+    :param key: номер года, квартала (год * 4 + квартал - 1) или месяца (год * 12 + месяц - 1)
+    :param period: 'year', 'quarter' или 'month'
+    :return: строка вида '2007', '2007-Q4' или '2007-12'
+
+    >>> period_label(8031, 'quarter'), period_label(24095, 'month')
+    ('2007-Q4', '2007-12')
+    """
+
+    if period == 'quarter':
+        return f'{key // 4}-Q{key % 4 + 1}'
+    if period == 'month':
+        return f'{key // 12}-{key % 12 + 1:02d}'
+    return str(key)
+
+
+class ExchangeRates:
+    """Класс для таблицы курсов валют к рублю по месяцам.
+    Для месяцев, которых нет в таблице, используется курс из currency_to_rub, если валюта там есть
+
+    Attributes:
+        rates (dict): {валюта: {номер месяца: курс}}
+    """
+
+    def __init__(self, rates=None):
+        """Инициализирует таблицу курсов
+
+        :param rates (dict): {валюта: {номер месяца: курс}}
+        """
+
+        self.rates = {} if rates is None else rates
+
+    @classmethod
+    def from_csv(cls, file_name):
+        """Загружает таблицу курсов из csv файла со столбцом date (вида 'YYYY-MM') и столбцами валют.
+            Пустые значения пропускаются
+
+        :param file_name: Имя csv файла с курсами
+        :return: ExchangeRates
+        """
+
+        rates = {}
+        with open(file_name, encoding='utf_8_sig') as r_file:
+            file_reader = csv.reader(r_file, delimiter=",")
+            list_naming = file_reader.__next__()
+            date_index = list_naming.index('date')
+            for row in file_reader:
+                for index, value in enumerate(row):
+                    if index != date_index and value != "":
+                        rates.setdefault(list_naming[index], {}).update(
+                            {month_key(row[date_index] + '-01'): float(value)})
+        return cls(rates)
+
+    def matrix(self, currencies, first_month, months_count, used=None):
+        """Возвращает массив курсов для перевода сумм по месяцам и валютам в рубли.
+            Курс берётся из таблицы, а для месяцев, которых в ней нет, - из currency_to_rub.
+            Если курса нет ни там, ни там, для ячеек из used выбрасывается ValueError,
+            остальные такие ячейки получают курс 0
+
+        :param currencies: список валют
+        :param first_month: номер первого месяца
+        :param months_count: количество месяцев
+        :param used (np.ndarray): маска ячеек, для которых курс нужен, по умолчанию нужен для всех
+        :return: np.ndarray размера (количество месяцев, количество валют)
+
+        >>> ExchangeRates({'USD': {24095: 30.0}}).matrix(['USD', 'RUR'], 24094, 2)
+        array([[60.66,  1.  ],
+               [30.  ,  1.  ]])
+        >>> ExchangeRates({'BYN': {24095: 30.0}}).matrix(['BYN'], 24095, 1)
+        array([[30.]])
+        """
+
+        rates = np.full((months_count, len(currencies)), np.nan)
+        for code, currency in enumerate(currencies):
+            if currency_to_rub.__contains__(currency):
+                rates[:, code] = currency_to_rub[currency]
+            for month, rate in self.rates.get(currency, {}).items():
+                if first_month <= month < first_month + months_count:
+                    rates[month - first_month, code] = rate
+        missing = np.isnan(rates)
+        needed = missing if used is None else missing & used
+        if needed.any():
+            month, code = np.argwhere(needed)[0]
+            raise ValueError(f'нет курса {currencies[code]} к рублю за {period_label(first_month + month, "month")}')
+        rates[missing] = 0
+        return rates
+
+
+class StatisticsAccumulator:
+    """Класс для подсчёта статистики за один проход по файлу.
+    Вместо самих вакансий хранит только накопленные суммы окладов и количества,
+    поэтому расход памяти не зависит от размера файла.
+
+    Суммы окладов накапливаются отдельно по каждой валюте и переводятся в рубли только при подсчёте статистики:
+    сумма целых окладов в одной валюте не зависит от порядка сложения, поэтому результат не меняется
+    при объединении нескольких аккумуляторов.
+
+    Attributes:
+        name      (str):  Название профессии
+        by_years  (dict): {год: [{валюта: сумма окладов}, количество вакансий,
+                                 {валюта: сумма окладов для профессии}, количество вакансий для профессии]}
+        by_cities (dict): {город: [{валюта: сумма окладов}, количество вакансий]}
+    """
+
+    def __init__(self, name):
+        """Инициализирует пустой аккумулятор
+
+        :param name (str): Название профессии, для которой считается отдельная статистика
+
+        >>> StatisticsAccumulator('Программист').statistics()
+        ({}, {})
+        """
+
+        self.name = name
+        self.by_years = {}
+        self.by_cities = {}
+
+    def add(self, vacancy):
+        """Учитывает вакансию в накопленной статистике
+
+        :param vacancy (Vacancy): вакансия
+        """
+
+        year = vacancy.year
+        if not self.by_years.keys().__contains__(year):
+            self.by_years.update({year: [{}, 0, {}, 0]})
+        if not self.by_cities.keys().__contains__(vacancy.area_name):
+            self.by_cities.update({vacancy.area_name: [{}, 0]})
+
+        year_total = self.by_years[year]
+        year_total[0][vacancy.salary_currency] = year_total[0].get(vacancy.salary_currency, 0) + vacancy.salary_average
+        year_total[1] += 1
+        if self.name in vacancy.name:
+            year_total[2][vacancy.salary_currency] = year_total[2].get(vacancy.salary_currency, 0) + \
+                                                     vacancy.salary_average
+            year_total[3] += 1
+
+        city_total = self.by_cities[vacancy.area_name]
+        city_total[0][vacancy.salary_currency] = city_total[0].get(vacancy.salary_currency, 0) + vacancy.salary_average
+        city_total[1] += 1
+
+    def add_all(self, vacancies):
+        """Учитывает все вакансии из итерируемого объекта
+
+        :param vacancies: итерируемый объект с вакансиями, например iter_vacancies(file_name)
+        :return: self
+        """
+
+        with tracer.stage('aggregate'):
+            for vacancy in vacancies:
+                self.add(vacancy)
+        return self
+
+    def merge(self, other):
+        """Добавляет к накопленной статистике статистику другого аккумулятора,
+            например посчитанного для другой части файла
+
+        :param other (StatisticsAccumulator): аккумулятор с той же профессией
+        :return: self
+        """
+
+        for key, (salary, count, salary_for_name, count_for_name) in other.by_years.items():
+            if not self.by_years.keys().__contains__(key):
+                self.by_years.update({key: [{}, 0, {}, 0]})
+            year_total = self.by_years[key]
+            merge_salary(year_total[0], salary)
+            year_total[1] += count
+            merge_salary(year_total[2], salary_for_name)
+            year_total[3] += count_for_name
+
+        for key, (salary, count) in other.by_cities.items():
+            if not self.by_cities.keys().__contains__(key):
+                self.by_cities.update({key: [{}, 0]})
+            city_total = self.by_cities[key]
+            merge_salary(city_total[0], salary)
+            city_total[1] += count
+        return self
+
+    def statistics(self):
+        """Функция рассчитывает статистику по накопленным суммам
+
+        :return: кортеж из двух словарей:
+            {год: [средняя зарплата за год, средняя зарплата за год для указанной вакансии,
+             количество вакансий за год, количество указанных вакансий за год]}
+            {город: [средняя зарплата по городу, процент вакансий в городе]}
+            В статистику по городам попадают только города, в которых не меньше 1% всех вакансий
+        """
+
+        statistics_by_years = {}
+        for key, (salary, count, salary_for_name, count_for_name) in self.by_years.items():
+            salary_for_name = 0 if count_for_name == 0 else int(to_rub(salary_for_name) / count_for_name)
+            statistics_by_years.update({str(key): [int(to_rub(salary) / count), salary_for_name, count,
+                                                   count_for_name]})
+
+        vacancies_count = self.vacancies_count()
+        statistics_by_cities = {}
+        for key, (salary, count) in self.by_cities.items():
+            if count < int(vacancies_count / 100):
                 continue
-            fieds = {}
-            for field_index in range(len(row)):
-                fieds.update({list_naming[field_index]: row[field_index]})
-            year = fieds["published_at"][:4]
-            vacancy = Vacancy(name=fieds["name"],
-                              salary_from=fieds["salary_from"],
-                              salary_to=fieds["salary_to"],
-                              salary_currency=fieds["salary_currency"],
-                              area_name=fieds["area_name"],
-                              published_at=fieds["published_at"])
-            if vacancies_city.keys().__contains__(vacancy.area_name):
-                vacancies_city[vacancy.area_name].append(vacancy)
-            else:
-                vacancies_city.update({vacancy.area_name: [vacancy]})
-            if vacancies.keys().__contains__(year):
-                vacancies[year].append(vacancy)
-            else:
-                vacancies.update({year: [vacancy]})
+            statistics_by_cities.update({key: [int(to_rub(salary) / count),
+                                               round(float(count / vacancies_count) * 100, 2)]})
+        return statistics_by_years, statistics_by_cities
+
+    def vacancies_count(self):
+        """Возвращает общее количество учтённых вакансий
+        """
+
+        return sum(self.by_cities[city][1] for city in self.by_cities)
+
+    def to_state(self):
+        """Возвращает накопленные суммы в виде, пригодном для сохранения в json.
+            Порядок годов и городов сохраняется
+
+        :return: словарь с профессией и списками накопленных сумм по годам и городам
+        """
+
+        return {'name': self.name,
+                'by_years': [[key] + value for key, value in self.by_years.items()],
+                'by_cities': [[key] + value for key, value in self.by_cities.items()]}
+
+    @classmethod
+    def from_state(cls, state):
+        """Восстанавливает аккумулятор из словаря, полученного в to_state
+
+        :param state: словарь с профессией и списками накопленных сумм
+        :return: StatisticsAccumulator
+
+        >>> accumulator = StatisticsAccumulator('Программист')
+        >>> accumulator.add(Vacancy('Программист', 10, 20, 'USD', 'Moscow', '2007-12-03T17:34:36+0300'))
+        >>> StatisticsAccumulator.from_state(json.loads(json.dumps(accumulator.to_state()))).statistics()
+        ({'2007': [909, 909, 1, 1]}, {'Moscow': [909, 100.0]})
+        """
+
+        accumulator = cls(state['name'])
+        accumulator.by_years = {value[0]: value[1:] for value in state['by_years']}
+        accumulator.by_cities = {value[0]: value[1:] for value in state['by_cities']}
+        return accumulator
+
+
+def aggregate_range(file_name, list_naming, start, end, name):
+    """Функция считает статистику по диапазону байт csv файла, используется как задача для пула процессов
+
+    :param file_name: Имя csv файла с данными
+    :param list_naming: список названий столбцов из заголовка файла
+    :param start: начало диапазона
+    :param end: конец диапазона
+    :param name: Название профессии
+    :return: StatisticsAccumulator с накопленной статистикой
+    """
+
+    return StatisticsAccumulator(name).add_all(tracer.iterate(vacancies_from_rows(list_naming,
+                                                                                  read_range(file_name, start, end)),
+                                                              'vacancy_build'))
+
+
+def parallel_file_statistics(file_name, name, workers=None, chunk_size=CHUNK_SIZE):
+    """Функция параллельно считает статистику по одному csv файлу: файл делится на диапазоны байт,
+        каждый процесс читает свой диапазон прямо из исходного файла, промежуточные файлы не создаются
+
+    :param file_name: Имя csv файла с данными
+    :param name: Название профессии
+    :param workers: количество процессов, по умолчанию равно количеству ядер
+    :param chunk_size: примерный размер диапазона в байтах
+    :return: StatisticsAccumulator с объединённой статистикой
+    """
+
+    list_naming, ranges = split_file(file_name, chunk_size)
+    accumulator = StatisticsAccumulator(name)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for partial in tracer.map(executor, aggregate_range, [file_name] * len(ranges), [list_naming] * len(ranges),
+                                  [start for start, end in ranges], [end for start, end in ranges],
+                                  [name] * len(ranges)):
+            accumulator.merge(partial)
+    return accumulator
+
+
+def incremental_statistics(file_name, name, state_file, quarantine=None):
+    """Функция считает статистику по файлу, в конец которого дописываются новые вакансии.
+        Накопленные суммы и смещение обработанной части файла сохраняются в state_file,
+        при следующем запуске разбираются только строки, дописанные после этого смещения.
+        Недописанная последняя строка без перевода строки откладывается до следующего запуска.
+        Если файл был укорочен, изменилась профессия или изменились первые либо последние 64 КБ обработанной части,
+        статистика считается заново. Изменения в середине обработанной части, не задевшие эти блоки, не обнаруживаются
+
+    :param file_name: Имя csv файла с данными
+    :param name: Название профессии
+    :param state_file: Имя json файла с сохранённым состоянием
+    :param quarantine: имя csv файла для строк, пропущенных при этом запуске
+    :return: StatisticsAccumulator со статистикой по всему файлу
+    """
+
+    def block_hash(start, end):
+        with open(file_name, 'rb') as r_file:
+            r_file.seek(start)
+            return hashlib.blake2b(r_file.read(end - start), digest_size=16).hexdigest()
+
+    def prefix_hashes(offset):
+        return [block_hash(0, min(offset, 65536)), block_hash(max(0, offset - 65536), offset)]
+
+    state = None
+    if os.path.exists(state_file):
+        with open(state_file, encoding='utf-8') as r_file:
+            state = json.load(r_file)
+        if state['accumulator']['name'] != name or os.path.getsize(file_name) < state['offset'] or \
+                prefix_hashes(state['offset']) != state.get('hashes'):
+            state = None
+
+    if state is None:
+        accumulator = StatisticsAccumulator(name)
+        list_naming, ranges = split_file(file_name, CHUNK_SIZE, complete_lines=True)
+    else:
+        accumulator = StatisticsAccumulator.from_state(state['accumulator'])
+        list_naming, ranges = split_file(file_name, CHUNK_SIZE, state['offset'], complete_lines=True)
+    with quarantine_writer(quarantine, list_naming) as writer:
+        for start, end in ranges:
+            accumulator.add_all(tracer.iterate(vacancies_from_rows(list_naming, read_range(file_name, start, end),
+                                                                   writer), 'vacancy_build'))
+
+    if not ranges:
+        return accumulator
+    offset = ranges[-1][1]
+    with open(state_file + '.tmp', 'w', encoding='utf-8') as w_file:
+        json.dump({'offset': offset, 'hashes': prefix_hashes(offset), 'accumulator': accumulator.to_state()},
+                  w_file, ensure_ascii=False)
+    os.replace(state_file + '.tmp', state_file)
+    return accumulator
+
+
+class VacancyColumns:
+    """Класс для столбцового представления вакансий в памяти.
+    Оклады хранятся в массивах float64, валюта, город и название вакансии - в массивах целочисленных кодов,
+    значения кодов перечислены в списках категорий в порядке первого появления в файле.
+    Статистика считается проходами np.bincount по массивам, без обращения к отдельным вакансиям:
+    вакансии складываются в куб сумм по месяцам и валютам, из которого получаются года, кварталы и месяцы.
+
+    Attributes:
+        salary_from (np.ndarray): Нижние границы окладов
+        salary_to   (np.ndarray): Верхние границы окладов
+        currency    (np.ndarray): Коды валют окладов, индексы в currencies
+        month       (np.ndarray): Номера месяцев публикации, см. month_key
+        city        (np.ndarray): Коды городов, индексы в cities
+        name        (np.ndarray): Коды названий вакансий, индексы в names
+        currencies  (list): Валюты
+        years       (list): Года публикации, строки вида 'YYYY', в порядке первого появления
+        cities      (list): Города
+        names       (list): Названия вакансий
+        index       (NameIndex): Индекс по названиям вакансий, если он построен
+        totals      (dict): Общая для всех профессий часть статистики по ключу (период, таблица курсов),
+                            см. common_statistics, а также куб по месяцам, группы названий и номера периодов
+    """
+
+    def __init__(self, salary_from, salary_to, currency, month, city, name, currencies, years, cities, names,
+                 index=None):
+        """Инициализирует объект VacancyColumns из готовых массивов и списков категорий
+        """
+
+        self.salary_from = salary_from
+        self.salary_to = salary_to
+        self.currency = currency
+        self.month = month
+        self.city = city
+        self.name = name
+        self.currencies = currencies
+        self.years = years
+        self.cities = cities
+        self.names = names
+        self.index = index
+        self.totals = {}
+
+    @classmethod
+    def from_vacancies(cls, vacancies):
+        """Собирает столбцы из итерируемого объекта с вакансиями за один проход и строит индекс по названиям
+
+        :param vacancies: итерируемый объект с вакансиями, например iter_vacancies(file_name)
+        :return: VacancyColumns
+
+        >>> columns = VacancyColumns.from_vacancies([Vacancy('Программист', 10, 20, 'USD', 'Moscow', '2007-12-03')])
+        >>> columns.salary_to, columns.years
+        (array([20.]), ['2007'])
+        """
+
+        with tracer.stage('columns_build'):
+            salary_from, salary_to = array('d'), array('d')
+            currency, month, city, name = array('i'), array('i'), array('i'), array('i')
+            currencies, cities, names = {}, {}, {}
+            for vacancy in vacancies:
+                salary_from.append(vacancy.salary_from)
+                salary_to.append(vacancy.salary_to)
+                currency.append(currencies.setdefault(vacancy.salary_currency, len(currencies)))
+                month.append(vacancy.month)
+                city.append(cities.setdefault(vacancy.area_name, len(cities)))
+                name.append(names.setdefault(vacancy.name, len(names)))
+            name, month = np.frombuffer(name, dtype=np.int32), np.frombuffer(month, dtype=np.int32)
+            years, first_rows = np.unique(month // 12, return_index=True)
+            return cls(np.frombuffer(salary_from, dtype=np.float64), np.frombuffer(salary_to, dtype=np.float64),
+                       np.frombuffer(currency, dtype=np.int32), month, np.frombuffer(city, dtype=np.int32), name,
+                       list(currencies), [str(key) for key in years[np.argsort(first_rows)]], list(cities),
+                       list(names), NameIndex.build(list(names), name))
+
+    @classmethod
+    def from_file(cls, file_name, use_cache=True, quarantine=None, buffer_size=READ_BUFFER):
+        """Читает столбцы из csv файла. При use_cache разобранные столбцы сохраняются в кэш рядом с файлом,
+            и повторные запуски по тому же файлу загружают их без разбора csv.
+            Пропущенные строки известны только при разборе, поэтому с quarantine кэш не используется
+
+        :param file_name: Имя csv файла с данными, допускается сжатие gzip и zstd
+        :param use_cache: использовать ли кэш
+        :param quarantine: имя csv файла для пропущенных строк
+        :param buffer_size: размер буфера чтения в байтах
+        :return: VacancyColumns
+        """
+
+        if not use_cache or quarantine is not None:
+            return cls.from_vacancies(iter_vacancies(file_name, quarantine, buffer_size))
+        with tracer.stage('load_columns'):
+            return cls.from_arrays(cached_arrays(
+                file_name, lambda: cls.from_vacancies(iter_vacancies(file_name, buffer_size=buffer_size)).to_arrays()))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Собирает столбцы из словаря массивов, полученного в to_arrays
+
+        :param arrays: словарь {имя массива: np.ndarray}
+        :return: VacancyColumns
+        """
+
+        currencies, years, cities, names = (unpack_strings(arrays[key + '_bytes'], arrays[key + '_offsets'])
+                                            for key in ('currencies', 'years', 'cities', 'names'))
+        return cls(arrays['salary_from'], arrays['salary_to'], arrays['currency'], arrays['month'], arrays['city'],
+                   arrays['name'], currencies, years, cities, names,
+                   NameIndex.from_arrays(names, arrays) if arrays.__contains__('index_trigrams') else None)
+
+    def to_arrays(self):
+        """Возвращает столбцы и списки категорий в виде словаря массивов numpy для сохранения на диск.
+            Списки категорий упаковываются в массивы байт utf-8 со смещениями, см. pack_strings
+
+        :return: словарь {имя массива: np.ndarray}
+        """
+
+        arrays = {'salary_from': self.salary_from, 'salary_to': self.salary_to, 'currency': self.currency,
+                  'month': self.month, 'city': self.city, 'name': self.name}
+        for key, strings in (('currencies', self.currencies), ('years', self.years), ('cities', self.cities),
+                             ('names', self.names)):
+            arrays.update(zip((key + '_bytes', key + '_offsets'), pack_strings(strings)))
+        if self.index is not None:
+            arrays.update(self.index.to_arrays())
+        return arrays
+
+    def __len__(self):
+        return len(self.salary_from)
+
+    def name_mask(self, name):
+        """Возвращает маску вакансий, в названии которых есть подстрока name.
+            Проверка подстроки выполняется один раз для каждого уникального названия
+
+        :param name (str): Название профессии
+        :return: np.ndarray типа bool длиной в количество вакансий
+        """
+
+        matched = np.array([name in vacancy_name for vacancy_name in self.names], dtype=bool)
+        return matched[self.name] if len(self.names) else np.zeros(0, dtype=bool)
+
+    def name_rows(self, name):
+        """Возвращает номера вакансий, в названии которых есть подстрока name.
+            Если построен индекс, просматриваются только подходящие вакансии, иначе все
+
+        :param name (str): Название профессии
+        :return: np.ndarray номеров вакансий по возрастанию
+        """
+
+        if self.index is None:
+            return np.flatnonzero(self.name_mask(name))
+        return self.index.rows(name)
+
+    def month_cube(self, rows=None):
+        """Считает суммы средних окладов по месяцам и валютам и количества вакансий по месяцам.
+            Из этого куба статистика по годам, кварталам и месяцам получается сложением месяцев, см. rollup
+
+        :param rows (np.ndarray): номера или маска учитываемых вакансий, по умолчанию учитываются все
+        :return: кортеж из массива сумм размера (количество месяцев, количество валют) и массива количеств вакансий
+        """
+
+        first_month, months_count = self.month_range()
+        salary_from, salary_to, currency, month = self.salary_from, self.salary_to, self.currency, self.month
+        if rows is not None:
+            salary_from, salary_to, currency, month = salary_from[rows], salary_to[rows], currency[rows], month[rows]
+        month = month - first_month
+        sums = np.bincount(month * len(self.currencies) + currency, weights=(salary_from + salary_to) / 2,
+                           minlength=months_count * len(self.currencies))
+        return sums.reshape(months_count, len(self.currencies)), np.bincount(month, minlength=months_count)
+
+    def month_range(self):
+        """Возвращает номер первого месяца публикации и количество месяцев до последнего.
+            Результат сохраняется в totals
+
+        :return: кортеж (номер первого месяца, количество месяцев)
+        """
+
+        if not self.totals.__contains__('months'):
+            first_month, last_month = (int(self.month.min()), int(self.month.max())) if len(self) else (0, 0)
+            self.totals.update({'months': (first_month, last_month - first_month + 1)})
+        return self.totals['months']
+
+    def period_index(self, period):
+        """Возвращает для каждого месяца куба номер его периода и подписи периодов.
+            Года идут в порядке первого появления в файле, кварталы и месяцы - по возрастанию,
+            в подписи попадают только периоды, в которых есть вакансии.
+            Месяцы без вакансий получают номер, равный количеству периодов. Результат сохраняется в totals
+
+        :param period: 'year', 'quarter' или 'month'
+        :return: кортеж из np.ndarray номеров периодов по месяцам и списка подписей
+        """
+
+        if not self.totals.__contains__(('index', period)):
+            self.totals.update({('index', period): self.build_period_index(period)})
+        return self.totals[('index', period)]
+
+    def build_period_index(self, period):
+        """Строит номера периодов и подписи для period_index
+
+        :param period: 'year', 'quarter' или 'month'
+        :return: кортеж, как в period_index
+        """
+
+        first_month, months_count = self.month_range()
+        keys = np.arange(first_month, first_month + months_count)
+        if period == 'year':
+            codes = {int(key): code for code, key in enumerate(self.years)}
+            return np.array([codes.get(int(key), len(codes)) for key in keys // 12], dtype=np.int64), self.years
+        keys = keys // 3 if period == 'quarter' else keys
+        present = np.unique(keys[self.common_cube()[1] > 0])
+        index = np.searchsorted(present, keys)
+        inside = index < len(present)
+        found = np.zeros(len(keys), dtype=bool)
+        found[inside] = present[index[inside]] == keys[inside]
+        index[~found] = len(present)
+        return index, [period_label(int(key), period) for key in present]
+
+    def common_cube(self):
+        """Возвращает куб month_cube по всем вакансиям, он считается один раз и сохраняется в totals
+
+        :return: кортеж, как в month_cube
+        """
+
+        if not self.totals.__contains__('cube'):
+            self.totals.update({'cube': self.month_cube()})
+        return self.totals['cube']
+
+    def rollup(self, sums, counts, period='year', rates=None):
+        """Складывает куб по месяцам в периоды и переводит суммы окладов в рубли.
+            Без таблицы курсов суммы по валютам переводятся в рубли по currency_to_rub,
+            с таблицей - суммы по месяцам и валютам переводятся по курсу своего месяца
+
+        :param sums (np.ndarray): суммы окладов размера (количество месяцев, количество валют), как в month_cube
+        :param counts (np.ndarray): количества вакансий по месяцам
+        :param period: 'year', 'quarter' или 'month'
+        :param rates (ExchangeRates): таблица курсов по месяцам
+        :return: кортеж из массивов сумм окладов в рублях и количеств вакансий по периодам
+        """
+
+        index, labels = self.period_index(period)
+        count = np.bincount(index, weights=counts, minlength=len(labels) + 1)[:len(labels)].astype(np.int64)
+        if rates is None:
+            by_period = np.zeros((len(labels) + 1, len(self.currencies)))
+            np.add.at(by_period, index, sums)
+            return self.to_rub(by_period[:len(labels)]), count
+        rub = (sums * self.rate_matrix(rates)).sum(axis=1)
+        return np.bincount(index, weights=rub, minlength=len(labels) + 1)[:len(labels)], count
+
+    def rate_matrix(self, rates):
+        """Возвращает курсы ExchangeRates.matrix для месяцев и валют куба.
+            Курс обязателен только для месяцев и валют, в которых есть вакансии. Результат сохраняется в totals
+
+        :param rates (ExchangeRates): таблица курсов по месяцам
+        :return: np.ndarray размера (количество месяцев, количество валют)
+        """
 
-        return vacancies, vacancies_city
+        if not self.totals.__contains__(('rates', rates)):
+            first_month, months_count = self.month_range()
+            used = np.bincount((self.month - first_month).astype(np.int64) * len(self.currencies) + self.currency,
+                               minlength=months_count * len(self.currencies)) > 0
+            self.totals.update({('rates', rates): rates.matrix(self.currencies, first_month, months_count,
+                                                               used.reshape(months_count, len(self.currencies)))})
+        return self.totals[('rates', rates)]
+
+    def to_rub(self, sums):
+        """Переводит суммы окладов по валютам в рубли, валюты складываются в том же порядке, что и в функции to_rub
+
+        :param sums (np.ndarray): массив сумм размера (количество групп, количество валют)
+        :return: np.ndarray сумм в рублях по группам
+        """
+
+        total = np.zeros(len(sums))
+        for code in sorted(range(len(self.currencies)), key=lambda code: self.currencies[code]):
+            total = total + sums[:, code] * currency_to_rub[self.currencies[code]]
+        return total
+
+    def statistics(self, name, period='year', rates=None):
+        """Функция рассчитывает статистику по периодам и городам.
+            Просматриваются только вакансии профессии, найденные через индекс названий.
+            Для period='year' без таблицы курсов результат совпадает со StatisticsAccumulator.statistics
+
+        :param name (str): Название профессии
+        :param period: 'year', 'quarter' или 'month'
+        :param rates (ExchangeRates): таблица курсов по месяцам, по умолчанию курсы currency_to_rub
+        :return: кортеж из двух словарей:
+            {период: [средняя зарплата за период, средняя зарплата за период для указанной вакансии,
+             количество вакансий за период, количество указанных вакансий за период]}
+            {город: [средняя зарплата по городу, процент вакансий в городе]}
+        """
+
+        return self.compose_statistics({name: self.rollup(*self.month_cube(self.name_rows(name)), period, rates)},
+                                       period, rates)[name]
+
+    def name_groups(self):
+        """Группирует вакансии по названию, месяцу и валюте. Группировка выполняется один раз и сохраняется в totals.
+            Группы упорядочены по коду названия, группы названия с кодом code занимают отрезок
+            [offsets[code], offsets[code + 1])
+
+        :return: кортеж из массивов начал отрезков групп по кодам названий, номеров ячеек куба
+            (месяц * количество валют + валюта), сумм средних окладов и количеств вакансий по группам
+        """
+
+        if not self.totals.__contains__('groups'):
+            first_month, months_count = self.month_range()
+            cells = (self.month - first_month).astype(np.int64) * len(self.currencies) + self.currency
+            groups, group_index = np.unique(self.name.astype(np.int64) * (months_count * len(self.currencies)) +
+                                            cells, return_inverse=True)
+            group_salary = np.bincount(group_index.reshape(-1), weights=(self.salary_from + self.salary_to) / 2,
+                                       minlength=len(groups))
+            group_count = np.bincount(group_index.reshape(-1), minlength=len(groups))
+            offsets = np.searchsorted(groups // (months_count * len(self.currencies)), np.arange(len(self.names) + 1))
+            self.totals.update({'groups': (offsets, groups % (months_count * len(self.currencies)), group_salary,
+                                           group_count)})
+        return self.totals['groups']
+
+    def batch_statistics(self, names, period='year', rates=None):
+        """Функция рассчитывает статистику сразу для нескольких профессий.
+            Названия вакансий просматриваются один раз автоматом ProfessionMatcher, вакансии один раз группируются
+            по названию, месяцу и валюте (name_groups), после чего куб каждой профессии собирается по группам,
+            а не по вакансиям, и складывается в годы, кварталы или месяцы через rollup
+
+        :param names: список названий профессий
+        :param period: 'year', 'quarter' или 'month'
+        :param rates (ExchangeRates): таблица курсов по месяцам
+        :return: словарь {профессия: кортеж из двух словарей, как в statistics}
+        """
+
+        matcher = ProfessionMatcher(names)
+        matched = np.zeros((len(names), len(self.names)), dtype=bool)
+        for code, vacancy_name in enumerate(self.names):
+            matched[sorted(matcher.find(vacancy_name)), code] = True
+
+        offsets, group_cell, group_salary, group_count = self.name_groups()
+        months_count = self.month_range()[1]
+        for_names = {}
+        for index, name in enumerate(names):
+            codes = np.flatnonzero(matched[index])
+            starts, lengths = offsets[codes], offsets[codes + 1] - offsets[codes]
+            selected = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            sums = np.bincount(group_cell[selected], weights=group_salary[selected],
+                               minlength=months_count * len(self.currencies))
+            counts = np.bincount(group_cell[selected] // len(self.currencies), weights=group_count[selected],
+                                 minlength=months_count)
+            for_names.update({name: self.rollup(sums.reshape(months_count, len(self.currencies)), counts, period,
+                                                rates)})
+        return self.compose_statistics(for_names, period, rates)
+
+    def common_statistics(self, period='year', rates=None):
+        """Функция считает общую для всех профессий часть статистики: подписи периодов,
+            суммы окладов и количества вакансий по периодам и статистику по городам.
+            Результат сохраняется в totals, поэтому при повторных запросах по всем вакансиям не проходит
+
+        :param period: 'year', 'quarter' или 'month'
+        :param rates (ExchangeRates): таблица курсов по месяцам
+        :return: кортеж (подписи периодов, суммы окладов по периодам, количества вакансий по периодам,
+            словарь статистики по городам, как в statistics)
+        """
+
+        if not self.totals.__contains__((period, rates)):
+            labels = self.period_index(period)[1]
+            salary, count = self.rollup(*self.common_cube(), period, rates)
+            if not self.totals.__contains__(('cities', rates)):
+                self.totals.update({('cities', rates): self.city_statistics(rates)})
+            self.totals.update({(period, rates): (labels, salary, count, self.totals[('cities', rates)])})
+        return self.totals[(period, rates)]
+
+    def city_statistics(self, rates=None):
+        """Функция считает статистику по городам, она не зависит от профессии и периода
+
+        :param rates (ExchangeRates): таблица курсов по месяцам
+        :return: словарь статистики по городам, как в statistics
+        """
+
+        salary = (self.salary_from + self.salary_to) / 2
+        count_by_city = np.bincount(self.city, minlength=len(self.cities))
+        if rates is None:
+            sums = np.bincount(self.city * len(self.currencies) + self.currency, weights=salary,
+                               minlength=len(self.cities) * len(self.currencies))
+            salary_by_city = self.to_rub(sums.reshape(len(self.cities), len(self.currencies)))
+        else:
+            cells = (self.month - self.month_range()[0]).astype(np.int64) * len(self.currencies) + self.currency
+            rate = self.rate_matrix(rates).reshape(-1)
+            salary_by_city = np.bincount(self.city, weights=salary * rate[cells], minlength=len(self.cities))
+
+        vacancies_count = len(self)
+        statistics_by_cities = {}
+        for code, key in enumerate(self.cities):
+            if count_by_city[code] < int(vacancies_count / 100):
+                continue
+            statistics_by_cities.update({key: [int(salary_by_city[code] / count_by_city[code]),
+                                               round(float(int(count_by_city[code]) / vacancies_count) * 100, 2)]})
+        return statistics_by_cities
+
+    def compose_statistics(self, for_names, period='year', rates=None):
+        """Функция собирает словари статистики, общая часть статистики берётся из common_statistics
+
+        :param for_names: словарь {профессия: (суммы окладов в рублях по периодам, количества вакансий по периодам)}
+        :param period: 'year', 'quarter' или 'month'
+        :param rates (ExchangeRates): таблица курсов по месяцам
+        :return: словарь {профессия: кортеж из двух словарей, как в statistics}
+        """
+
+        labels, salary, count, statistics_by_cities = self.common_statistics(period, rates)
+        result = {}
+        for name, (salary_for_name, count_for_name) in for_names.items():
+            statistics_by_years = {}
+            for code, key in enumerate(labels):
+                statistics_by_years.update({key: [int(salary[code] / count[code]),
+                                                  0 if count_for_name[code] == 0 else
+                                                  int(salary_for_name[code] / count_for_name[code]),
+                                                  int(count[code]), int(count_for_name[code])]})
+            result.update({name: (statistics_by_years, {key: list(value) for key, value in
+                                                        statistics_by_cities.items()})})
+        return result
+
+
+class NameIndex:
+    """Инвертированный индекс по названиям вакансий для поиска профессии по подстроке без просмотра всех вакансий.
+    Для каждой триграммы хранится список кодов названий, в которые она входит,
+    для каждого кода названия - список номеров вакансий с этим названием.
+    Списки хранятся в массивах numpy подряд, границы списков - в массивах смещений.
+
+    Attributes:
+        names           (list):       Названия вакансий, как в VacancyColumns.names
+        trigrams        (np.ndarray): Отсортированные триграммы
+        trigram_offsets (np.ndarray): Границы списков кодов названий для каждой триграммы
+        trigram_names   (np.ndarray): Коды названий, подряд для всех триграмм
+        name_offsets    (np.ndarray): Границы списков номеров вакансий для каждого кода названия
+        name_rows       (np.ndarray): Номера вакансий, упорядоченные по коду названия
+    """
+
+    def __init__(self, names, trigrams, trigram_offsets, trigram_names, name_offsets, name_rows):
+        """Инициализирует объект NameIndex из готовых массивов
+        """
+
+        self.names = names
+        self.trigrams = trigrams
+        self.trigram_offsets = trigram_offsets
+        self.trigram_names = trigram_names
+        self.name_offsets = name_offsets
+        self.name_rows = name_rows
+
+    @classmethod
+    def build(cls, names, name_codes):
+        """Строит индекс по списку названий и кодам названий вакансий
+
+        :param names: список уникальных названий вакансий
+        :param name_codes (np.ndarray): код названия для каждой вакансии
+        :return: NameIndex
+
+        >>> NameIndex.build(['Аналитик', 'Программист'], np.array([1, 0, 1])).rows('алит')
+        array([1])
+        """
+
+        postings = {}
+        for code, name in enumerate(names):
+            for trigram in {name[i:i + 3] for i in range(len(name) - 2)}:
+                postings.setdefault(trigram, []).append(code)
+        trigrams = sorted(postings)
+        trigram_offsets = np.zeros(len(trigrams) + 1, dtype=np.int64)
+        trigram_offsets[1:] = np.cumsum([len(postings[trigram]) for trigram in trigrams])
+        trigram_names = np.array([code for trigram in trigrams for code in postings[trigram]], dtype=np.int32)
+
+        name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        name_offsets[1:] = np.cumsum(np.bincount(name_codes, minlength=len(names)))
+        return cls(names, np.array(trigrams, dtype='<U3'), trigram_offsets, trigram_names, name_offsets,
+                   np.argsort(name_codes, kind='stable').astype(np.int64))
+
+    @classmethod
+    def from_arrays(cls, names, arrays):
+        """Собирает индекс из словаря массивов, полученного в to_arrays
+
+        :param names: список уникальных названий вакансий
+        :param arrays: словарь {имя массива: np.ndarray}
+        :return: NameIndex
+        """
+
+        return cls(names, arrays['index_trigrams'], arrays['index_trigram_offsets'], arrays['index_trigram_names'],
+                   arrays['index_name_offsets'], arrays['index_name_rows'])
+
+    def to_arrays(self):
+        """Возвращает массивы индекса для сохранения на диск вместе со столбцами
+
+        :return: словарь {имя массива: np.ndarray}
+        """
+
+        return {'index_trigrams': self.trigrams, 'index_trigram_offsets': self.trigram_offsets,
+                'index_trigram_names': self.trigram_names, 'index_name_offsets': self.name_offsets,
+                'index_name_rows': self.name_rows}
+
+    def find_names(self, name):
+        """Возвращает коды названий вакансий, в которые входит подстрока name.
+            Кандидаты отбираются пересечением списков триграмм запроса и проверяются сравнением строк
+
+        :param name (str): Название профессии
+        :return: список кодов названий по возрастанию
+        """
+
+        if len(name) < 3:
+            return [code for code, vacancy_name in enumerate(self.names) if name in vacancy_name]
+
+        candidates = None
+        for trigram in sorted({name[i:i + 3] for i in range(len(name) - 2)}):
+            position = int(np.searchsorted(self.trigrams, trigram))
+            if position == len(self.trigrams) or self.trigrams[position] != trigram:
+                return []
+            codes = self.trigram_names[self.trigram_offsets[position]:self.trigram_offsets[position + 1]]
+            candidates = codes if candidates is None else np.intersect1d(candidates, codes, assume_unique=True)
+        return [int(code) for code in np.sort(candidates) if name in self.names[code]]
+
+    def rows(self, name):
+        """Возвращает номера вакансий, в названии которых есть подстрока name
+
+        :param name (str): Название профессии
+        :return: np.ndarray номеров вакансий по возрастанию
+        """
+
+        rows = [self.name_rows[self.name_offsets[code]:self.name_offsets[code + 1]] for code in self.find_names(name)]
+        return np.sort(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+
+
+class ProfessionMatcher:
+    """Автомат Ахо-Корасик для поиска сразу нескольких названий профессий в строке за один её просмотр
+
+    Attributes:
+        goto   (list): переходы автомата, для каждого состояния словарь {символ: состояние}
+        fail   (list): суффиксные ссылки состояний
+        output (list): для каждого состояния множество индексов профессий, найденных при переходе в него
+    """
+
+    def __init__(self, patterns):
+        """Строит автомат по списку названий профессий
+
+        :param patterns: список названий профессий
+
+        >>> sorted(ProfessionMatcher(['аналитик', 'Аналитик', 'тик']).find('Бизнес-аналитик'))
+        [0, 2]
+        """
+
+        self.goto, self.fail, self.output = [{}], [0], [set()]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if not self.goto[state].__contains__(char):
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and not self.goto[fail].__contains__(char):
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """Возвращает индексы профессий, названия которых входят в строку
+
+        :param text (str): строка, например название вакансии
+        :return: множество индексов профессий
+        """
+
+        state, found = 0, set(self.output[0])
+        for char in text:
+            while state and not self.goto[state].__contains__(char):
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            found |= self.output[state]
+        return found
 
 
 class VacancyTests(TestCase):
@@ -89,25 +1117,308 @@ class VacancyTests(TestCase):
 class CsvParserTests(TestCase):
     """Этот класс тестирует работу метода csv_parser на заранее определенно верных примерах
     """
+    @classmethod
+    def setUpClass(cls):
+        cls.file_name = os.path.join(tempfile.mkdtemp(), 'vacancies_by_year.csv')
+        with open(cls.file_name, 'w', encoding='utf_8_sig', newline='') as w_file:
+            csv.writer(w_file).writerows([
+                ['name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at'],
+                ['Программист', '30000.0', '50000.0', 'RUR', 'Москва', '2007-08-25T10:00:00+0300'],
+                ['Менеджер', '176000.0', '189000.0', 'RUR', 'Санкт-Петербург', '2007-07-14T10:00:00+0300'],
+                ['Аналитик', '', '1000.0', 'USD', 'Москва', '2008-01-14T10:00:00+0300']])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(os.path.dirname(cls.file_name))
+
     def test_salary_currency(self):
-        self.assertEqual(сsv_parser('vacancies_by_year.csv')[0]['2007'][0].salary_currency, 'RUR')
+        self.assertEqual(сsv_parser(self.file_name)[0]['2007'][0].salary_currency, 'RUR')
 
     def test_salary_average(self):
-        self.assertEqual(сsv_parser('vacancies_by_year.csv')[0]['2007'][0].salary_average, 40000.0)
+        self.assertEqual(сsv_parser(self.file_name)[0]['2007'][0].salary_average, 40000.0)
+
+
+class StatisticsAccumulatorTests(TestCase):
+    """Этот класс тестирует подсчёт статистики классом StatisticsAccumulator
+    """
+    def setUp(self):
+        self.vacancies = [Vacancy('Программист', 10, 20, 'RUR', 'Moscow', '2007-12-03T17:34:36+0300'),
+                          Vacancy('Аналитик', 30, 50, 'RUR', 'Moscow', '2007-12-03T17:34:36+0300'),
+                          Vacancy('Программист', 1, 1, 'USD', 'Perm', '2008-12-03T17:34:36+0300')]
+
+    def test_statistics_by_years(self):
+        self.assertEqual(StatisticsAccumulator('Программист').add_all(self.vacancies).statistics()[0],
+                         {'2007': [27, 15, 2, 1], '2008': [60, 60, 1, 1]})
+
+    def test_statistics_by_cities(self):
+        self.assertEqual(StatisticsAccumulator('Программист').add_all(self.vacancies).statistics()[1],
+                         {'Moscow': [27, 66.67], 'Perm': [60, 33.33]})
+
+    def test_merge(self):
+        merged = StatisticsAccumulator('Программист').add_all(self.vacancies[:1])
+        merged.merge(StatisticsAccumulator('Программист').add_all(self.vacancies[1:]))
+        self.assertEqual(merged.statistics(), StatisticsAccumulator('Программист').add_all(self.vacancies).statistics())
+
+    def test_vacancy_columns(self):
+        self.assertEqual(VacancyColumns.from_vacancies(self.vacancies).statistics('Программист'),
+                         StatisticsAccumulator('Программист').add_all(self.vacancies).statistics())
+
+    def test_period_statistics(self):
+        columns = VacancyColumns.from_vacancies(self.vacancies)
+        self.assertEqual(columns.statistics('Программист', 'quarter')[0],
+                         {'2007-Q4': [27, 15, 2, 1], '2008-Q4': [60, 60, 1, 1]})
+        self.assertEqual(columns.statistics('Программист', 'month', ExchangeRates({'USD': {24107: 30.0}})),
+                         ({'2007-12': [27, 15, 2, 1], '2008-12': [30, 30, 1, 1]}, {'Moscow': [27, 66.67],
+                                                                                   'Perm': [30, 33.33]}))
+
+    def test_table_only_currency(self):
+        columns = VacancyColumns.from_vacancies(self.vacancies + [Vacancy('Программист', 2, 4, 'BYN', 'Perm',
+                                                                          '2008-12-01')])
+        self.assertEqual(columns.statistics('Программист', 'year', ExchangeRates({'BYN': {24107: 10.0}}))[0],
+                         {'2007': [27, 15, 2, 1], '2008': [45, 45, 2, 2]})
+        with self.assertRaises(ValueError):
+            columns.statistics('Программист', 'year', ExchangeRates({'BYN': {24106: 10.0}}))
+
+    def test_name_index(self):
+        columns = VacancyColumns.from_vacancies(self.vacancies)
+        for name in ['Программист', 'грам', 'Аналитик', 'ик', '', 'Водитель']:
+            self.assertEqual(columns.index.rows(name).tolist(), np.flatnonzero(columns.name_mask(name)).tolist())
+
+    def test_batch_statistics(self):
+        columns = VacancyColumns.from_vacancies(self.vacancies)
+        names = ['Программист', 'Аналитик', 'грам', 'Водитель']
+        self.assertEqual(columns.batch_statistics(names), {name: columns.statistics(name) for name in names})
+        rates = ExchangeRates({'USD': {24107: 30.0}})
+        self.assertEqual(columns.batch_statistics(names, 'quarter', rates),
+                         {name: columns.statistics(name, 'quarter', rates) for name in names})
+
+
+def write_test_vacancies(file_name):
+    """Функция записывает csv файл со 100 вакансиями для тестов
+
+    :param file_name: имя создаваемого файла
+    :return: file_name
+    """
+
+    with open(file_name, 'w', encoding='utf_8_sig', newline='') as w_file:
+        writer = csv.writer(w_file)
+        writer.writerow(['name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at'])
+        for i in range(100):
+            writer.writerow([f'Программист {i}', i, 2 * i, 'RUR', f'Город {i % 7}', f'{2007 + i % 3}-01-01'])
+    return file_name
+
+
+class VacanciesFileTestCase(TestCase):
+    """Базовый класс для тестов, которым нужен csv файл с вакансиями, см. write_test_vacancies
+    """
+    def setUp(self):
+        self.file_name = write_test_vacancies(os.path.join(tempfile.mkdtemp(), 'vacancies.csv'))
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.file_name))
+
+
+class SplitFileTests(VacanciesFileTestCase):
+    """Этот класс тестирует деление csv файла на диапазоны байт и их параллельную обработку
+    """
+    def test_ranges_cover_all_rows(self):
+        list_naming, ranges = split_file(self.file_name, 100)
+        rows = [row for start, end in ranges for row in read_range(self.file_name, start, end)]
+        with open(self.file_name, encoding='utf_8_sig') as r_file:
+            self.assertEqual([list_naming] + rows, list(csv.reader(r_file)))
+
+    def test_quoted_newlines(self):
+        with open(self.file_name, 'a', encoding='utf-8', newline='') as w_file:
+            writer = csv.writer(w_file)
+            for i in range(30):
+                writer.writerow([f'Программист\n"{i}"', i, i + 1, 'RUR', 'Город\n0', '2020-01-01'])
+        expected = StatisticsAccumulator('Программист').add_all(iter_vacancies(self.file_name)).statistics()
+        self.assertEqual(parallel_file_statistics(self.file_name, 'Программист', 2, 100).statistics(), expected)
+        with open(self.file_name, 'a', encoding='utf-8', newline='') as w_file:
+            w_file.write('Программист,1,1,RUR,"Город\n')
+        list_naming, ranges = split_file(self.file_name, 100, complete_lines=True)
+        rows = [row for start, end in ranges for row in read_range(self.file_name, start, end)]
+        self.assertEqual(len(rows), 130)
+
+    def test_parallel_file_statistics(self):
+        self.assertEqual(parallel_file_statistics(self.file_name, 'Программист', 2, 100).statistics(),
+                         StatisticsAccumulator('Программист').add_all(iter_vacancies(self.file_name)).statistics())
+
+
+class VacancyCacheTests(VacanciesFileTestCase):
+    """Этот класс тестирует кэш разобранных столбцов на диске
+    """
+    def test_cached_columns(self):
+        with open(self.file_name, 'a', encoding='utf-8', newline='') as w_file:
+            csv.writer(w_file).writerow(['Программист ' + 'ё' * 200, 1, 1, 'RUR', 'Город 0', '2020-01-01'])
+        expected = VacancyColumns.from_file(self.file_name, use_cache=False)
+        for columns in [VacancyColumns.from_file(self.file_name), VacancyColumns.from_file(self.file_name)]:
+            self.assertEqual((columns.names, columns.cities), (expected.names, expected.cities))
+            self.assertEqual(columns.statistics('Программист 1'), expected.statistics('Программист 1'))
+
+    def test_concurrent_cache(self):
+        file_names = []
+        for i in range(4):
+            file_names.append(os.path.join(os.path.dirname(self.file_name), f'vacancies_{i}.csv'))
+            shutil.copy(self.file_name, file_names[-1])
+            with open(file_names[-1], 'a', encoding='utf-8', newline='') as w_file:
+                csv.writer(w_file).writerows([['Программист', 1, 1, 'RUR', 'Город 0', '2020-01-01']] * i)
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            self.assertEqual([len(columns) for columns in executor.map(VacancyColumns.from_file, file_names * 2)],
+                             [100, 101, 102, 103] * 2)
+        self.assertEqual(len(read_index(cache_dir_for(self.file_name))), 4)
+
+    def test_unavailable_cache(self):
+        arrays = cached_arrays(self.file_name, lambda: {'values': np.arange(3)},
+                               os.path.join(self.file_name, 'cache'))
+        self.assertEqual(arrays['values'].tolist(), [0, 1, 2])
+
+    def test_cache_invalidation(self):
+        VacancyColumns.from_file(self.file_name)
+        with open(self.file_name, 'a', encoding='utf-8', newline='') as w_file:
+            csv.writer(w_file).writerow(['Программист', 1, 1, 'RUR', 'Город 0', '2020-01-01'])
+        self.assertEqual(len(VacancyColumns.from_file(self.file_name)), 101)
+
+
+class IncrementalStatisticsTests(VacanciesFileTestCase):
+    """Этот класс тестирует дочитывание дописанного файла с сохранённым состоянием
+    """
+    def test_incremental_statistics(self):
+        state_file = self.file_name + '.state.json'
+        incremental_statistics(self.file_name, 'Программист', state_file)
+        with open(self.file_name, 'a', encoding='utf-8', newline='') as w_file:
+            w_file.write('Программист,5,7,USD,Город 100,2021-01-01\nПрограммист,1,1,RUR,Город 0,20')
+        self.assertEqual(incremental_statistics(self.file_name, 'Программист', state_file).vacancies_count(), 101)
+        with open(self.file_name, 'a', encoding='utf-8', newline='') as w_file:
+            w_file.write('21-01-01\n')
+        expected = StatisticsAccumulator('Программист').add_all(iter_vacancies(self.file_name)).statistics()
+        self.assertEqual(incremental_statistics(self.file_name, 'Программист', state_file).statistics(), expected)
+        self.assertEqual(incremental_statistics(self.file_name, 'Программист', state_file).statistics(), expected)
+
+    def test_changed_head(self):
+        state_file = self.file_name + '.state.json'
+        with open(self.file_name, 'a', encoding='utf-8', newline='') as w_file:
+            csv.writer(w_file).writerows([['Аналитик', 1, 1, 'RUR', 'Город 0', '2020-01-01']] * 3000)
+        incremental_statistics(self.file_name, 'Программист', state_file)
+        with open(self.file_name, 'r+b') as w_file:
+            w_file.seek(len('\ufeffname,salary_from,salary_to,salary_currency,area_name,published_at\r\n'.encode()))
+            w_file.write('Аналитик      '.encode())
+        expected = StatisticsAccumulator('Программист').add_all(iter_vacancies(self.file_name)).statistics()
+        self.assertEqual(incremental_statistics(self.file_name, 'Программист', state_file).statistics(), expected)
+
+
+class ReportSuffixTests(VacanciesFileTestCase):
+    """Этот класс тестирует имена файлов отчётов для нескольких профессий
+    """
+    def test_report_suffix(self):
+        directory, cwd = tempfile.mkdtemp(), os.getcwd()
+        os.chdir(directory)
+        try:
+            main([self.file_name, '-p', '1С/программист', '-p', 'Программист', '-f', 'excel', '--no-cache',
+                  '--render-workers', '1'])
+            self.assertEqual(sorted(os.listdir(directory)),
+                             ['report_1_1С_программист.xlsx', 'report_2_Программист.xlsx'])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+
+class TracerTests(VacanciesFileTestCase):
+    """Этот класс тестирует замеры этапов обработки
+    """
+    def test_trace(self):
+        with open(self.file_name, 'a', encoding='utf-8', newline='') as w_file:
+            w_file.write('Программист,,1,RUR,Город 0,2020-01-01\n')
+        tracer.reset(True)
+        try:
+            parallel_file_statistics(self.file_name, 'Программист', 2, 100)
+            self.assertEqual(tracer.counters, {'rows': 101, 'dropped_rows': 1})
+            self.assertEqual(tracer.stages['vacancy_build']['items'], 100)
+        finally:
+            tracer.reset()
+
+    def test_chunk_script_trace(self):
+        trace = os.path.join(os.path.dirname(self.file_name), 'trace.json')
+        try:
+            chunk_script.main([self.file_name, '--trace', trace])
+        finally:
+            tracer.reset()
+        with open(trace, encoding='utf-8') as r_file:
+            stages = json.load(r_file)['stages']
+        self.assertEqual((stages['generate_chunks']['calls'], stages['csv_decode']['items']), (1, 100))
+
+
+class CompressedInputTests(VacanciesFileTestCase):
+    """Этот класс тестирует чтение сжатых csv файлов
+    """
+    def setUp(self):
+        super().setUp()
+        with open(self.file_name, 'rb') as r_file, gzip.open(self.file_name + '.gz', 'wb') as w_file:
+            w_file.write(r_file.read())
+
+    def test_gzip_input(self):
+        self.assertEqual(VacancyColumns.from_file(self.file_name + '.gz', use_cache=False).statistics('Программист'),
+                         VacancyColumns.from_file(self.file_name, use_cache=False).statistics('Программист'))
+
+    def test_state_rejected(self):
+        with self.assertRaises(SystemExit), redirect_stderr(io.StringIO()):
+            parse_args([self.file_name + '.gz', '--state', self.file_name + '.state.json'])
+
+
+class QuarantineTests(VacanciesFileTestCase):
+    """Этот класс тестирует запись пропущенных строк в файл с причиной пропуска
+    """
+    def test_quarantine_reasons(self):
+        with open(self.file_name, 'a', encoding='utf-8', newline='') as w_file:
+            w_file.write('Программист,,1,RUR,Город 0,2020-01-01\nПрограммист,x,1,RUR,Город 0,2020-01-01\nПрограммист\n'
+                         'Программист,1,1,XYZ,Город 0,2020-01-01\n')
+        quarantine = self.file_name + '.rejected.csv'
+        self.assertEqual(len(VacancyColumns.from_file(self.file_name, quarantine=quarantine)), 100)
+        with open(quarantine, encoding='utf-8') as r_file:
+            self.assertEqual([row[-1] for row in csv.reader(r_file)],
+                             ['reason', 'empty', 'value', 'columns', 'currency'])
+        self.assertEqual(VacancyColumns.from_file(self.file_name).statistics('Программист'),
+                         StatisticsAccumulator('Программист').add_all(iter_vacancies(self.file_name)).statistics())
+
+
+class ReportTests(TestCase):
+    """Этот класс тестирует построение отчётов
+    """
+    def test_chart_png(self):
+        self.assertTrue(Report('Программист').chart_png({'2007': [10, 20, 3, 1]}, {'Moscow': [15, 100.0]})
+                        .startswith(b'\x89PNG'))
+
+    def test_render(self):
+        directory, cwd = tempfile.mkdtemp(), os.getcwd()
+        os.chdir(directory)
+        try:
+            render_reports([(Report('Программист'), {'2007': [10, 20, 3, 1]}, {'Moscow': [15, 100.0]},
+                             ['excel', 'png'], '_test')], 2)
+            self.assertEqual(sorted(os.listdir(directory)), ['graph_test.png', 'report_test.xlsx'])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
 class Vacancy:
     """Класс для представления вакансии.
+    Атрибуты хранятся в __slots__, строки названия, валюты и региона интернируются,
+    поэтому одинаковые значения разных вакансий занимают память один раз.
+    От даты публикации хранится только номер месяца, см. month_key.
+
     Attributes:
-        name            (str):  Наименование вакансии
-        salary_from     (int):  Нижняя граница оклада
-        salary_to       (int):  Верхняя граница оклада
-        salary_average  (int):  Среднее значение оклада
-        salary_currency (str):  Валюта оклада
-        area_name       (str):  Название региона вакансии
-        published_at    (str):  Дата публикации вакансии
+        name            (str):   Наименование вакансии
+        salary_from     (float): Нижняя граница оклада
+        salary_to       (float): Верхняя граница оклада
+        salary_average  (float): Среднее значение оклада, вычисляется при обращении
+        salary_currency (str):   Валюта оклада
+        area_name       (str):   Название региона вакансии
+        month           (int):   Номер месяца публикации вакансии, год * 12 + месяц - 1
+        year            (int):   Год публикации вакансии, вычисляется при обращении
     """
 
+    __slots__ = ('name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'month')
+
     def __init__(self, name, salary_from, salary_to, salary_currency, area_name, published_at):
-        """Инициализирует объект Vacancy, выполняет рассчёт среднего значения оклада
+        """Инициализирует объект Vacancy
 
         :param name            (str):  Наименование вакансии
         :param salary_from     (int):  Нижняя граница оклада
@@ -122,27 +1433,107 @@ class Vacancy:
         15.0
         >>> Vacancy('Программист', 10, 20, 'USD', 'Moscow', '2007-12-03T17:34:36+0300').salary_currency
         'USD'
+        >>> Vacancy('Программист', 10, 20, 'USD', 'Moscow', '2007-12-03T17:34:36+0300').year
+        2007
         """
 
-        self.name = name
+        self.fill(name, salary_from, salary_to, salary_currency, area_name, month_key(published_at))
+
+    @classmethod
+    def from_fields(cls, name, salary_from, salary_to, salary_currency, area_name, month):
+        """Создаёт объект Vacancy по уже известному номеру месяца публикации, без разбора даты
+
+        :param name            (str):  Наименование вакансии
+        :param salary_from     (str):  Нижняя граница оклада
+        :param salary_to       (str):  Верхняя граница оклада
+        :param salary_currency (str):  Валюта оклада
+        :param area_name       (str):  Название региона вакансии
+        :param month           (int):  Номер месяца публикации, см. month_key
+        :return: Vacancy
+
+        >>> Vacancy.from_fields('Программист', '10', '20', 'USD', 'Moscow', 24095).year
+        2007
+        """
+
+        vacancy = cls.__new__(cls)
+        vacancy.fill(name, salary_from, salary_to, salary_currency, area_name, month)
+        return vacancy
+
+    def fill(self, name, salary_from, salary_to, salary_currency, area_name, month):
+        """Заполняет атрибуты вакансии, используется в __init__ и from_fields
+
+        :param name            (str):  Наименование вакансии
+        :param salary_from     (str):  Нижняя граница оклада
+        :param salary_to       (str):  Верхняя граница оклада
+        :param salary_currency (str):  Валюта оклада
+        :param area_name       (str):  Название региона вакансии
+        :param month           (int):  Номер месяца публикации, см. month_key
+        """
+
+        self.name = sys.intern(name)
         self.salary_from = float(salary_from)
         self.salary_to = float(salary_to)
-        self.salary_average = (self.salary_from + self.salary_to) / 2
-        self.salary_currency = salary_currency
-        self.area_name = area_name
-        self.published_at = published_at
+        self.salary_currency = sys.intern(salary_currency)
+        self.area_name = sys.intern(area_name)
+        self.month = month
+
+    @property
+    def year(self):
+        """Год публикации вакансии
+        """
+
+        return self.month // 12
+
+    @property
+    def salary_average(self):
+        """Среднее значение оклада
+        """
+
+        return (self.salary_from + self.salary_to) / 2
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_template():
+    """Функция загружает и компилирует шаблон пдф отчёта один раз на процесс
+
+    :return: jinja2.Template
+    """
+
+    from jinja2 import Environment, FileSystemLoader
+
+    env = Environment(loader=FileSystemLoader(os.path.dirname(os.path.abspath(__file__))))
+    return env.get_template("pdf_template.html")
 
 
 class Report:
     """Класс для формирования отчёта
 
         Attributes:
-            font_size (int): размер шрифта в отчёте
+            font_size   (int): размер шрифта в отчёте
+            wkhtmltopdf (str): путь к wkhtmltopdf, по умолчанию берётся из переменной окружения WKHTMLTOPDF,
+                               при пустом значении wkhtmltopdf ищется в PATH
     """
 
     font_size = 12
+    wkhtmltopdf = os.environ.get('WKHTMLTOPDF', '')
+
+    """
+    matplotlib, openpyxl, jinja2 и pdfkit импортируются внутри методов, которые их используют,
+    чтобы запуск без графиков или без пдф не тратил время на загрузку этих библиотек
+    """
 
-    def generate_png(self, statics_by_years, statics_by_cities):
+    def __init__(self, name, wkhtmltopdf=None):
+        """Инициализирует объект Report
+
+        :param name (str): Название профессии, для которой строится отчёт
+        :param wkhtmltopdf (str): путь к wkhtmltopdf, по умолчанию Report.wkhtmltopdf
+        """
+
+        self.name = name
+        if wkhtmltopdf is not None:
+            self.wkhtmltopdf = wkhtmltopdf
+
+    def generate_png(self, statics_by_years, statics_by_cities, file_name='graph.png'):
         """Функция генерирующая графики по статистике
         Args:
             :param statics_by_years: словарь, содержащий значения типа:
@@ -151,10 +1542,27 @@ class Report:
 
             :param statics_by_cities: словарь, содержащий значения типа:
             {город: [средняя зарплата по городу, процент вакансий в городе]}
+
+            :param file_name: имя файла с графиками
+        """
+
+        with open(file_name, 'wb') as w_file:
+            w_file.write(self.chart_png(statics_by_years, statics_by_cities))
+
+    def chart_png(self, statics_by_years, statics_by_cities):
+        """Функция строит графики по статистике в памяти, без файла на диске.
+            Используется объектный интерфейс matplotlib, поэтому графики можно строить в нескольких потоках
+
+        :param statics_by_years: статистика по годам, как в generate_png
+        :param statics_by_cities: статистика по городам, как в generate_png
+        :return: содержимое png файла
         """
 
-        fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(18, 12))
-        plt.xticks(fontsize=8)
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(18, 12))
+        axes = fig.subplots(nrows=2, ncols=2)
+        axes[1][1].tick_params(axis='x', labelsize=8)
         years = np.arange(len(statics_by_years.keys()))
         cities = np.arange(len(statics_by_cities))
 
@@ -171,7 +1579,7 @@ class Report:
 
         axes[0][1].bar(years, [x[2] for x in statics_by_years.values()], width=0.4, label="Количество вакансий")
         axes[0][1].bar([x + 0.4 for x in years], [x[3] for x in statics_by_years.values()], width=0.4,
-                       label=f"Количество вакансий{name}")
+                       label=f"Количество вакансий{self.name}")
         axes[0][1].set_xticks(years, statics_by_years.keys(), rotation=90, ha='right')
         axes[0][1].yaxis.grid(True)
         axes[0][1].set_title("Количество вакансий по годам")
@@ -192,11 +1600,14 @@ class Report:
             [sum([x[1] for x in (list(statics_by_cities.values()))[10:]])]),
                        labels=(list(statics_by_cities.keys()))[:10] + ['Другие'], colors=colors)
 
-        fig.savefig('graph.png')
-        plt.close(fig)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png')
+        return buffer.getvalue()
 
-    def generate_excel(self, statics_by_years, statics_by_cities):
-        """Функция генерирующая эксель таблицу по статистике
+    def generate_excel(self, statics_by_years, statics_by_cities, file_name='report.xlsx'):
+        """Функция генерирующая эксель таблицу по статистике.
+            Таблица пишется в режиме write_only: строки сразу уходят в файл, стили ячеек задаются
+            именованными стилями, ширина столбцов считается один раз по самому длинному значению
 
         Args:
             :param statics_by_years: словарь, содержащий значения типа:
@@ -206,76 +1617,71 @@ class Report:
             :param statics_by_cities: словарь, содержащий значения типа:
                 {город: [средняя зарплата по городу, процент вакансий в городе]}
 
+            :param file_name: имя файла таблицы
+
+        """
+
+        from openpyxl import Workbook
+        from openpyxl.styles import Font, NamedStyle
+        from openpyxl.styles.borders import Border, Side
+
+        wb = Workbook(write_only=True)
+        border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'),
+                        bottom=Side(style='thin'))
+        for style in [NamedStyle(name='report_header', font=Font(name='Calibri', size=self.font_size, bold=True),
+                                 border=border),
+                      NamedStyle(name='report_value', font=Font(name='Calibri', size=self.font_size), border=border),
+                      NamedStyle(name='report_percent', font=Font(name='Calibri', size=self.font_size),
+                                 border=border, number_format='0.00%'),
+                      NamedStyle(name='report_empty', border=border)]:
+            wb.add_named_style(style)
+
+        self.write_sheet(wb, "Статистика по годам",
+                         ["Год", "Средняя зарплата", f"Средняя зарплата - {self.name}", "Количество вакансий",
+                          f"Количество вакансий - {self.name}"],
+                         [[key] + statics_by_years[key] for key in statics_by_years])
+        self.write_sheet(wb, "Статистика по городам", ['Город', 'Уровень зарплат', ' ', 'Город', 'Доля вакансий'],
+                         [[key, statics_by_cities[key][0], ' ', key, statics_by_cities[key][1]]
+                          for key in statics_by_cities], percent_column=4)
+        wb.save(file_name)
+
+    def write_sheet(self, wb, title, header, rows, percent_column=None):
+        """Функция добавляет в книгу write_only лист с заголовком и строками,
+            ячейки оформляются именованными стилями из generate_excel
+
+        :param wb: книга openpyxl в режиме write_only
+        :param title: название листа
+        :param header: список заголовков столбцов
+        :param rows: список строк со значениями
+        :param percent_column: номер столбца (с нуля), значения которого выводятся в процентном формате
         """
 
-        wb = Workbook()
-        wb.remove(wb['Sheet'])
-
-        statistics_by_year_sheet = wb.create_sheet("Статистика по годам")
-        statistics_by_year_sheet.append(["Год", "Средняя зарплата", f"Средняя зарплата - {name}", "Количество вакансий",
-                                         f"Количество вакансий - {name}"])
-        for key in statics_by_years:
-            statistics_by_year_sheet.append([key] + statics_by_years[key])
-
-        cols_dict = {}
-        for row in statistics_by_year_sheet.rows:
-            for cell in row:
-                letter = cell.column_letter
-                cell.border = Border(left=Side(style='thin'),
-                                     right=Side(style='thin'),
-                                     top=Side(style='thin'),
-                                     bottom=Side(style='thin'))
-                if cell.value:
-                    cell.font = Font(name='Calibri', size=self.font_size)
-                    len_cell = len(str(cell.value))
-                    len_cell_dict = 0
-                    if letter in cols_dict:
-                        len_cell_dict = cols_dict[letter]
-
-                    if len_cell > len_cell_dict:
-                        cols_dict[letter] = len_cell
-                        ###!!! ПРОБЛЕМА АВТОМАТИЧЕСКОЙ ПОДГОНКИ !!!###
-                        ###!!! расчет новой ширины колонки (здесь надо подгонять) !!!###
-                        new_width_col = len_cell * self.font_size ** (self.font_size * 0.009)
-                        statistics_by_year_sheet.column_dimensions[cell.column_letter].width = new_width_col
-
-        for cell in statistics_by_year_sheet[1:1]:
-            cell.font = Font(name='Calibri', size=self.font_size, bold=True)
-
-        statistics_by_cities_sheet = wb.create_sheet("Статистика по городам")
-        statistics_by_cities_sheet.append(['Город', 'Уровень зарплат', ' ', 'Город', 'Доля вакансий'])
-        for key in statics_by_cities:
-            statistics_by_cities_sheet.append([key, statics_by_cities[key][0], ' ', key, statics_by_cities[key][1]])
-
-        cols_dict = {}
-        for row in statistics_by_cities_sheet.rows:
-            for cell in row:
-                letter = cell.column_letter
-                cell.border = Border(left=Side(style='thin'),
-                                     right=Side(style='thin'),
-                                     top=Side(style='thin'),
-                                     bottom=Side(style='thin'))
-                if cell.value:
-                    cell.font = Font(name='Calibri', size=self.font_size)
-                    len_cell = len(str(cell.value))
-                    len_cell_dict = 0
-                    if letter in cols_dict:
-                        len_cell_dict = cols_dict[letter]
-
-                    if len_cell > len_cell_dict:
-                        cols_dict[letter] = len_cell
-                        ###!!! ПРОБЛЕМА АВТОМАТИЧЕСКОЙ ПОДГОНКИ !!!###
-                        ###!!! расчет новой ширины колонки (здесь надо подгонять) !!!###
-                        new_width_col = len_cell * self.font_size ** (self.font_size * 0.009)
-                        statistics_by_cities_sheet.column_dimensions[cell.column_letter].width = new_width_col
-
-        for cell in statistics_by_cities_sheet['E']:
-            cell.number_format = '0.00%'
-        for cell in statistics_by_cities_sheet[1:1]:
-            cell.font = Font(name='Calibri', size=self.font_size, bold=True)
-        wb.save('report.xlsx')
-
-    def generate_report(self, statics_by_years, statics_by_cities):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+
+        sheet = wb.create_sheet(title)
+        for column in range(len(header)):
+            len_cell = max((len(str(row[column])) for row in [header] + rows if row[column]), default=0)
+            if len_cell:
+                ###!!! ПРОБЛЕМА АВТОМАТИЧЕСКОЙ ПОДГОНКИ !!!###
+                ###!!! расчет новой ширины колонки (здесь надо подгонять) !!!###
+                sheet.column_dimensions[get_column_letter(column + 1)].width = \
+                    len_cell * self.font_size ** (self.font_size * 0.009)
+
+        for row_index, row in enumerate([header] + rows):
+            cells = []
+            for column, value in enumerate(row):
+                cell = WriteOnlyCell(sheet, value=value)
+                if row_index == 0:
+                    cell.style = 'report_header'
+                elif not value:
+                    cell.style = 'report_empty'
+                else:
+                    cell.style = 'report_percent' if column == percent_column else 'report_value'
+                cells.append(cell)
+            sheet.append(cells)
+
+    def generate_report(self, statics_by_years, statics_by_cities, file_name='out.pdf', chart=None):
         """Функция генерирующая пдф файл с отчётом по статистике
 
         Args:
@@ -286,95 +1692,250 @@ class Report:
             :param statics_by_cities: словарь, содержащий значения типа:
                 {город: [средняя зарплата по городу, процент вакансий в городе]}
 
+            :param file_name: имя пдф файла
+
+            :param chart: содержимое png файла с графиками, если графики уже построены
+
         """
-        self.generate_png(statics_by_years, statics_by_cities)
-        env = Environment(loader=FileSystemLoader('.'))
-        template = env.get_template("pdf_template.html")
-        config = pdfkit.configuration(wkhtmltopdf=r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe")
+        import pdfkit
 
-        pdf_template = template.render({'items': statics_by_years, 'items2': statics_by_cities})
+        if chart is None:
+            chart = self.chart_png(statics_by_years, statics_by_cities)
+        config = pdfkit.configuration(wkhtmltopdf=self.wkhtmltopdf)
+
+        html = pdf_template().render({'items': statics_by_years, 'items2': statics_by_cities, 'name': self.name,
+                                      'graph': base64.b64encode(chart).decode('ascii')})
         options = {'enable-local-file-access': None}
-        pdfkit.from_string(pdf_template, 'out.pdf', options=options, configuration=config)
-
-isReport = input('Введите данные для печати:') == 'Статистика'
-
-filename, name = input("Введите название файла: "), input("Введите название профессии: ")
-
-"""
-при пустом вводе имени файла подставляет стандартное имя файла
-"""
-if filename == "":
-    filename = "vacancies_by_year.csv"
-
-vacancies, vacancies_city = сsv_parser(filename)
-vacancies_count = sum(len(vacancies_city[i]) for i in vacancies_city)
-city_to_pop = []
-for city in vacancies_city:
-    if (len(vacancies_city[city]) < int(vacancies_count / 100)):
-        city_to_pop.append(city)
-
-for city in city_to_pop:
-    vacancies_city.pop(city)
-
-map(lambda k, v: (k, v) if len(vacancies_city[k]) > vacancies_count / 100 else None, vacancies_city)
-
-# region
-"""Блок обработки данных, для каждого года находится средний оклад по всем професси и указанной, а также подсчитывается
-количество вакансий по всем профессиям и указанной. Для каждого года подсчитывается средняя зп, а также доля вакансий
-"""
-
-statistics_by_years = {}
-vacancies_count_by_years, vacancies_salary_by_years, \
-vacancies_count_by_years_for_name, vacancies_salary_by_years_for_name = {}, {}, {}, {}
-for key in vacancies.keys():
-    vacancies_count_by_years.update({key: len(vacancies[key])})
-    vacancies_salary_by_years.update({key: int(
-        sum(x.salary_average * currency_to_rub[x.salary_currency] for x in vacancies[key]) / vacancies_count_by_years[
-            key])})
-    vacancies_count_by_years_for_name.update({key: len(list(filter(lambda x: (name in x.name), vacancies[key])))})
-    if vacancies_count_by_years_for_name[key] == 0:
-        vacancies_salary_by_years_for_name.update({key: 0})
+        pdfkit.from_string(html, file_name, options=options, configuration=config)
+
+    def render(self, statics_by_years, statics_by_cities, formats, suffix=''):
+        """Функция сохраняет отчёт в выбранных форматах, графики строятся один раз и используются для png и pdf
+
+        :param statics_by_years: статистика по годам, как в generate_png
+        :param statics_by_cities: статистика по городам, как в generate_png
+        :param formats: список форматов из 'png', 'excel', 'pdf'
+        :param suffix: суффикс имён файлов: graph{suffix}.png, report{suffix}.xlsx, out{suffix}.pdf
+        """
+
+        if formats.__contains__('excel'):
+            with tracer.stage('render_excel'):
+                self.generate_excel(statics_by_years, statics_by_cities, f'report{suffix}.xlsx')
+        if formats.__contains__('png') or formats.__contains__('pdf'):
+            with tracer.stage('render_chart'):
+                chart = self.chart_png(statics_by_years, statics_by_cities)
+                if formats.__contains__('png'):
+                    with open(f'graph{suffix}.png', 'wb') as w_file:
+                        w_file.write(chart)
+            if formats.__contains__('pdf'):
+                with tracer.stage('render_pdf'):
+                    self.generate_report(statics_by_years, statics_by_cities, f'out{suffix}.pdf', chart)
+
+
+def render_reports(jobs, workers=None):
+    """Функция параллельно сохраняет отчёты в пуле процессов.
+        Эксель таблица и графики с пдф каждого отчёта не зависят друг от друга и строятся в разных процессах
+
+    :param jobs: список кортежей (Report, статистика по годам, статистика по городам, форматы, суффикс имён файлов)
+    :param workers: количество процессов, по умолчанию равно количеству ядер; при 1 отчёты строятся в текущем процессе
+    """
+
+    tasks = []
+    for report, statics_by_years, statics_by_cities, formats, suffix in jobs:
+        for task_formats in [[f for f in formats if f == 'excel'], [f for f in formats if f in ('png', 'pdf')]]:
+            if task_formats:
+                tasks.append((report, statics_by_years, statics_by_cities, task_formats, suffix))
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(tasks) < 2:
+        for report, statics_by_years, statics_by_cities, formats, suffix in tasks:
+            report.render(statics_by_years, statics_by_cities, formats, suffix)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(tracer.map(executor, Report.render, *zip(*tasks)))
+
+def report_suffix(name, index):
+    """Функция возвращает суффикс имён файлов отчёта для профессии.
+        Символы, недопустимые в именах файлов, заменяются на '_', к суффиксу добавляется номер профессии,
+        чтобы разные профессии не получили одинаковые имена файлов
+
+    :param name: название профессии
+    :param index: номер профессии в списке
+    :return: суффикс вида '_1_название'
+
+    >>> report_suffix('1С/программист', 0)
+    '_1_1С_программист'
+    """
+
+    return f'_{index + 1}_' + re.sub(r'[\\/:*?"<>|\x00-\x1f]', '_', name).strip(' .')
+
+
+def print_statistics(statistics_by_years, statistics_by_cities, vacancies_count_by_city, vacancies_count):
+    """Функция выводит промежуточные данные в консоль
+
+    :param statistics_by_years: статистика по годам, как в StatisticsAccumulator.statistics
+    :param statistics_by_cities: статистика по городам, как в StatisticsAccumulator.statistics
+    :param vacancies_count_by_city: словарь {город: количество вакансий}
+    :param vacancies_count: общее количество вакансий
+    """
+
+    vacancies_salary_by_years = {key: value[0] for key, value in statistics_by_years.items()}
+    vacancies_salary_by_years_for_name = {key: value[1] for key, value in statistics_by_years.items()}
+    vacancies_count_by_years = {key: value[2] for key, value in statistics_by_years.items()}
+    vacancies_count_by_years_for_name = {key: value[3] for key, value in statistics_by_years.items()}
+
+    vacancies_salary_by_city = {key: value[0] for key, value in statistics_by_cities.items()}
+    vacancies_proportion_by_city = {key: float(int(vacancies_count_by_city[key]) / vacancies_count)
+                                    for key in statistics_by_cities}
+
+    temp = '\''
+    print(f"Динамика уровня зарплат по годам: {str(vacancies_salary_by_years).replace(temp, '')}")
+    print("Динамика количества вакансий по годам: " + str(vacancies_count_by_years).replace(temp, ''))
+    print(
+        "Динамика уровня зарплат по годам для выбранной профессии: " + str(vacancies_salary_by_years_for_name).replace(
+            temp, ''))
+    print(
+        "Динамика количества вакансий по годам для выбранной профессии: " + str(
+            vacancies_count_by_years_for_name).replace(temp, ''))
+    vacancies_salary_by_city = {k: v for k, v in
+                                sorted(vacancies_salary_by_city.items(), key=lambda item: item[1], reverse=True)[0:10]}
+    vacancies_proportion_by_city = {k: round(v, 4) for k, v in
+                                    sorted(vacancies_proportion_by_city.items(), key=lambda item: item[1],
+                                           reverse=True)[0:10]}
+
+    print("Уровень зарплат по городам (в порядке убывания): " + str(vacancies_salary_by_city))
+    print(f"Доля вакансий по городам (в порядке убывания): {str(vacancies_proportion_by_city)}")
+
+
+def analyze(file_name, names, workers=None, chunk_size=CHUNK_SIZE, use_cache=True, state_file=None, period='year',
+            rates=None, quarantine=None, buffer_size=READ_BUFFER):
+    """Функция считает статистику по файлу для одной или нескольких профессий
+
+    :param file_name: Имя csv файла с данными
+    :param names: список названий профессий
+    :param workers: количество процессов, при None файл обрабатывается в одном процессе
+    :param chunk_size: примерный размер диапазона байт для параллельной обработки
+    :param use_cache: использовать ли кэш разобранных столбцов
+    :param state_file: файл состояния для инкрементального подсчёта одной профессии, см. incremental_statistics
+    :param period: период статистики: 'year', 'quarter' или 'month'
+    :param rates (ExchangeRates): таблица курсов по месяцам, по умолчанию курсы currency_to_rub.
+    :param quarantine: имя csv файла для пропущенных строк
+    :param buffer_size: размер буфера чтения в байтах.
+        Кварталы, месяцы, таблица курсов, сохранение пропущенных строк и сжатые файлы
+        поддерживаются только при обработке в одном процессе
+    :return: кортеж из словаря {профессия: (статистика по годам, статистика по городам)},
+        словаря {город: количество вакансий} и общего количества вакансий
+    """
+
+    if state_file is not None:
+        accumulator = incremental_statistics(file_name, names[0], state_file, quarantine)
+    elif workers is None or len(names) > 1 or period != 'year' or rates is not None or quarantine is not None or \
+            compression(file_name) is not None:
+        columns = VacancyColumns.from_file(file_name, use_cache, quarantine, buffer_size)
+        with tracer.stage('statistics'):
+            if len(names) > 1:
+                statistics = columns.batch_statistics(names, period, rates)
+            else:
+                statistics = {names[0]: columns.statistics(names[0], period, rates)}
+        vacancies_count_by_city = dict(zip(columns.cities, np.bincount(columns.city, minlength=len(columns.cities))))
+        return statistics, vacancies_count_by_city, len(columns)
     else:
-        vacancies_salary_by_years_for_name.update({key: int(sum(
-            x.salary_average * currency_to_rub[x.salary_currency] for x in
-            list(filter(lambda x: (name in x.name), vacancies[key]))) / vacancies_count_by_years_for_name[key])})
-    statistics_by_years.update({key: [vacancies_salary_by_years[key], vacancies_salary_by_years_for_name[key],
-                                      vacancies_count_by_years[key], vacancies_count_by_years_for_name[key]]})
-
-statistics_by_cities = {}
-vacancies_salary_by_city, vacancies_proportion_by_city = {}, {}
-for key in vacancies_city.keys():
-    vacancies_salary_by_city.update(
-        {key: int(sum(map(lambda x: x.salary_average * currency_to_rub[x.salary_currency], vacancies_city[key])) / len(
-            vacancies_city[key]))})
-    vacancies_proportion_by_city.update({key: float(len(vacancies_city[key]) / vacancies_count)})
-    statistics_by_cities.update(
-        {key: [vacancies_salary_by_city[key], round(vacancies_proportion_by_city[key] * 100, 2)]})
-# endregion
-
-if isReport:
-    Report().generate_report(statistics_by_years, statistics_by_cities)
-else:
-    Report().generate_excel(statistics_by_years, statistics_by_cities)
-
-# region
-"""Блок вывода промежуточных данных в консоль
-"""
-temp = '\''
-print(f"Динамика уровня зарплат по годам: {str(vacancies_salary_by_years).replace(temp, '')}")
-print("Динамика количества вакансий по годам: " + str(vacancies_count_by_years).replace(temp, ''))
-print(
-    "Динамика уровня зарплат по годам для выбранной профессии: " + str(vacancies_salary_by_years_for_name).replace(temp,
-                                                                                                                   ''))
-print(
-    "Динамика количества вакансий по годам для выбранной профессии: " + str(vacancies_count_by_years_for_name).replace(
-        temp, ''))
-vacancies_salary_by_city = {k: v for k, v in
-                            sorted(vacancies_salary_by_city.items(), key=lambda item: item[1], reverse=True)[0:10]}
-vacancies_proportion_by_city = {k: round(v, 4) for k, v in
-                                sorted(vacancies_proportion_by_city.items(), key=lambda item: item[1], reverse=True)[
-                                0:10]}
-
-print("Уровень зарплат по городам (в порядке убывания): " + str(vacancies_salary_by_city))
-print(f"Доля вакансий по городам (в порядке убывания): {str(vacancies_proportion_by_city)}")
-# endregion
+        accumulator = parallel_file_statistics(file_name, names[0], workers, chunk_size)
+    vacancies_count_by_city = {key: value[1] for key, value in accumulator.by_cities.items()}
+    return {names[0]: accumulator.statistics()}, vacancies_count_by_city, accumulator.vacancies_count()
+
+
+def parse_args(argv):
+    """Функция разбирает аргументы командной строки.
+        При запуске без аргументов параметры запрашиваются у пользователя, как раньше
+
+    :param argv: список аргументов без имени программы
+    :return: argparse.Namespace
+    """
+
+    parser = argparse.ArgumentParser(description='Статистика вакансий по годам и городам')
+    parser.add_argument('file', nargs='?', default='vacancies_by_year.csv', help='csv файл с вакансиями')
+    parser.add_argument('-p', '--profession', action='append', default=[],
+                        help='название профессии, можно указать несколько раз')
+    parser.add_argument('-f', '--format', action='append', choices=['console', 'excel', 'png', 'pdf'],
+                        help='формат вывода, можно указать несколько раз (по умолчанию console и excel)')
+    parser.add_argument('-w', '--workers', type=int, help='количество процессов для параллельной обработки')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='размер диапазона байт для процесса')
+    parser.add_argument('--no-cache', action='store_true', help='не использовать кэш разобранных данных')
+    parser.add_argument('--state', help='файл состояния: при повторных запусках разбираются только дописанные строки')
+    parser.add_argument('--period', choices=['year', 'quarter', 'month'], default='year',
+                        help='период статистики (по умолчанию year)')
+    parser.add_argument('--rates', help='csv файл с курсами валют по месяцам: столбец date (YYYY-MM) и столбцы валют')
+    parser.add_argument('--render-workers', type=int,
+                        help='количество процессов для построения отчётов (по умолчанию равно количеству ядер)')
+    parser.add_argument('--wkhtmltopdf', help='путь к wkhtmltopdf (по умолчанию WKHTMLTOPDF или поиск в PATH)')
+    parser.add_argument('--quarantine', help='csv файл для пропущенных строк с причиной в столбце reason')
+    parser.add_argument('--buffer-size', type=int, default=READ_BUFFER, help='размер буфера чтения файла в байтах')
+    parser.add_argument('--trace', help='json файл для замеров этапов: время, строки, пропущенные строки, память')
+    parser.add_argument('--profile', help='файл для статистики cProfile основного процесса (pstats)')
+
+    if not argv:
+        isReport = input('Введите данные для печати:') == 'Статистика'
+        filename, name = input("Введите название файла: "), input("Введите название профессии: ")
+        workers = input("Введите количество процессов: ")
+        argv = [filename or 'vacancies_by_year.csv', '-f', 'console', '-f', 'pdf' if isReport else 'excel']
+        argv += sum((['-p', profession.strip()] for profession in name.split(';')), []) if ';' in name else ['-p', name]
+        argv += ['-w', workers] if workers else []
+
+    args = parser.parse_args(argv)
+    args.format = args.format or ['console', 'excel']
+    args.profession = args.profession or ['']
+    if args.state is not None and len(args.profession) > 1:
+        parser.error('--state можно использовать только с одной профессией')
+    if args.state is not None and (args.period != 'year' or args.rates is not None):
+        parser.error('--state нельзя использовать вместе с --period и --rates')
+    if args.state is not None and os.path.isfile(args.file) and compression(args.file) is not None:
+        parser.error('--state нельзя использовать для сжатых файлов')
+    return args
+
+
+def run(args):
+    """Функция считает статистику и выводит её в выбранных форматах
+
+    :param args: argparse.Namespace из parse_args
+    """
+
+    rates = None if args.rates is None else ExchangeRates.from_csv(args.rates)
+    statistics, vacancies_count_by_city, vacancies_count = analyze(args.file, args.profession, args.workers,
+                                                                   args.chunk_size, not args.no_cache, args.state,
+                                                                   args.period, rates, args.quarantine,
+                                                                   args.buffer_size)
+
+    render_reports([(Report(name, args.wkhtmltopdf), statistics_by_years, statistics_by_cities, args.format,
+                      '' if len(statistics) == 1 else report_suffix(name, index))
+                     for index, (name, (statistics_by_years, statistics_by_cities)) in enumerate(statistics.items())],
+                   args.render_workers)
+
+    if args.format.__contains__('console'):
+        for name, (statistics_by_years, statistics_by_cities) in statistics.items():
+            if len(statistics) > 1:
+                print(f"Профессия: {name}")
+            print_statistics(statistics_by_years, statistics_by_cities, vacancies_count_by_city, vacancies_count)
+
+
+def main(argv=None):
+    """Точка входа программы: считает статистику и выводит её в выбранных форматах.
+        Для нескольких профессий каждый файл отчёта получает суффикс с номером и названием профессии, см. report_suffix.
+        С --trace замеры этапов сохраняются в json, с --profile работа профилируется cProfile
+
+    :param argv: список аргументов без имени программы, по умолчанию sys.argv[1:]
+    """
+
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    tracer.reset(args.trace is not None)
+    if args.profile is None:
+        run(args)
+    else:
+        profiler = cProfile.Profile()
+        profiler.runcall(run, args)
+        profiler.dump_stats(args.profile)
+    if args.trace is not None:
+        tracer.save(args.trace)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from unittest import IsolatedAsyncioTestCase
+from urllib.parse import parse_qs, urlsplit
+
+from chunk_script import READ_BUFFER
+from program import ExchangeRates, Report, VacancyColumns
+
+PERIODS = ('year', 'quarter', 'month')
+
+
+class LRUCache:
+    """Класс для кэша результатов с вытеснением давно не использованных записей.
+        Хранятся asyncio.Future, поэтому одновременные запросы одного результата вычисляют его один раз
+
+    Attributes:
+        max_size (int): максимальное количество записей
+        entries (OrderedDict): {ключ: asyncio.Future}, в конце самые свежие записи
+    """
+
+    def __init__(self, max_size):
+        """Инициализирует пустой кэш
+
+        :param max_size (int): максимальное количество записей
+        """
+
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    async def get(self, key, compute):
+        """Возвращает результат из кэша, при промахе вычисляет его.
+            Если вычисление завершилось ошибкой, запись удаляется и ошибка передаётся всем ожидающим
+
+        :param key: ключ записи
+        :param compute: функция без аргументов, возвращающая корутину или future с результатом
+        :return: результат
+        """
+
+        if self.entries.__contains__(key):
+            self.entries.move_to_end(key)
+            return await asyncio.shield(self.entries[key])
+        future = asyncio.ensure_future(compute())
+        self.entries.update({key: future})
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            if self.entries.get(key) is future:
+                self.entries.pop(key)
+            raise
+
+
+def render_png(name, statics_by_years, statics_by_cities):
+    """Функция строит графики отчёта, используется как задача для пула процессов
+
+    :param name: название профессии
+    :param statics_by_years: статистика по годам, как в Report.generate_png
+    :param statics_by_cities: статистика по городам, как в Report.generate_png
+    :return: содержимое png файла
+    """
+
+    return Report(name).chart_png(statics_by_years, statics_by_cities)
+
+
+def render_excel(name, statics_by_years, statics_by_cities):
+    """Функция строит эксель таблицу отчёта в памяти, используется как задача для пула процессов
+
+    :param name: название профессии
+    :param statics_by_years: статистика по годам, как в Report.generate_excel
+    :param statics_by_cities: статистика по городам, как в Report.generate_excel
+    :return: содержимое xlsx файла
+    """
+
+    buffer = io.BytesIO()
+    Report(name).generate_excel(statics_by_years, statics_by_cities, buffer)
+    return buffer.getvalue()
+
+
+class StatisticsService:
+    """Класс для HTTP сервиса статистики вакансий. Данные загружаются в память один раз при запуске,
+        статистика и отчёты кэшируются. Статистика считается в потоке, отчёты строятся в пуле процессов,
+        поэтому долгое построение отчёта не задерживает остальные запросы.
+
+    Запросы:
+        GET /statistics?profession=...&period=year — статистика в json
+        GET /graph.png?profession=...&period=year — графики
+        GET /report.xlsx?profession=...&period=year — эксель таблица
+
+    Attributes:
+        columns (VacancyColumns): вакансии в памяти
+        rates (ExchangeRates): таблица курсов по месяцам или None
+        statistics_cache (LRUCache): кэш статистики
+        artifacts_cache (LRUCache): кэш png и xlsx файлов
+        executor (ProcessPoolExecutor): пул процессов для построения отчётов. Процессы запускаются через forkserver,
+            а не fork, потому что у сервиса уже есть потоки, и копия их блокировок в дочернем процессе
+            может привести к зависанию
+    """
+
+    def __init__(self, columns, rates=None, cache_size=256, artifacts_cache_size=64, render_workers=None):
+        """Инициализирует сервис
+
+        :param columns (VacancyColumns): вакансии
+        :param rates (ExchangeRates): таблица курсов по месяцам, по умолчанию курсы currency_to_rub
+        :param cache_size (int): количество записей в кэше статистики
+        :param artifacts_cache_size (int): количество записей в кэше отчётов
+        :param render_workers (int): количество процессов для построения отчётов, по умолчанию равно количеству ядер
+        """
+
+        self.columns = columns
+        self.rates = rates
+        self.statistics_cache = LRUCache(cache_size)
+        self.artifacts_cache = LRUCache(artifacts_cache_size)
+        self.executor = ProcessPoolExecutor(max_workers=render_workers,
+                                            mp_context=multiprocessing.get_context('forkserver'))
+
+    def close(self):
+        """Останавливает пул процессов
+        """
+
+        self.executor.shutdown()
+
+    async def statistics(self, name, period):
+        """Возвращает статистику по профессии из кэша или считает её в потоке
+
+        :param name: название профессии
+        :param period: период статистики: 'year', 'quarter' или 'month'
+        :return: кортеж (статистика по годам, статистика по городам)
+        """
+
+        return await self.statistics_cache.get(
+            (name, period),
+            lambda: asyncio.to_thread(self.columns.statistics, name, period, self.rates))
+
+    async def artifact(self, kind, name, period):
+        """Возвращает png или xlsx отчёт из кэша или строит его в пуле процессов
+
+        :param kind: 'png' или 'xlsx'
+        :param name: название профессии
+        :param period: период статистики
+        :return: содержимое файла
+        """
+
+        async def compute():
+            statics_by_years, statics_by_cities = await self.statistics(name, period)
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, render_png if kind == 'png' else render_excel, name, statics_by_years,
+                statics_by_cities)
+
+        return await self.artifacts_cache.get((kind, name, period), compute)
+
+    async def respond(self, path, query):
+        """Обрабатывает запрос
+
+        :param path: путь запроса
+        :param query: словарь {параметр: [значения]} из parse_qs
+        :return: кортеж (HTTPStatus, тип содержимого, содержимое)
+        """
+
+        name = query.get('profession', [''])[0]
+        period = query.get('period', ['year'])[0]
+        if not PERIODS.__contains__(period):
+            return HTTPStatus.BAD_REQUEST, 'text/plain; charset=utf-8', f'неизвестный период {period}'.encode()
+        if path == '/statistics':
+            statics_by_years, statics_by_cities = await self.statistics(name, period)
+            body = {'profession': name, 'period': period, 'by_years': statics_by_years,
+                    'by_cities': statics_by_cities, 'vacancies_count': len(self.columns)}
+            return HTTPStatus.OK, 'application/json; charset=utf-8', json.dumps(body, ensure_ascii=False).encode()
+        if path == '/graph.png':
+            return HTTPStatus.OK, 'image/png', await self.artifact('png', name, period)
+        if path == '/report.xlsx':
+            return HTTPStatus.OK, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', \
+                await self.artifact('xlsx', name, period)
+        return HTTPStatus.NOT_FOUND, 'text/plain; charset=utf-8', 'не найдено'.encode()
+
+    async def handle(self, reader, writer):
+        """Обрабатывает одно соединение: читает запрос, отвечает и закрывает соединение
+
+        :param reader (asyncio.StreamReader): поток чтения
+        :param writer (asyncio.StreamWriter): поток записи
+        """
+
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            method, target = head.decode('latin-1').split('\r\n', 1)[0].split(' ')[:2]
+            url = urlsplit(target)
+            if method != 'GET':
+                status, content_type, body = HTTPStatus.METHOD_NOT_ALLOWED, 'text/plain; charset=utf-8', b''
+            else:
+                status, content_type, body = await self.respond(url.path, parse_qs(url.query))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status, content_type, body = HTTPStatus.BAD_REQUEST, 'text/plain; charset=utf-8', b''
+        except Exception as error:
+            print(f'Ошибка обработки запроса: {error!r}', file=sys.stderr)
+            status, content_type, body = HTTPStatus.INTERNAL_SERVER_ERROR, 'text/plain; charset=utf-8', b''
+        try:
+            writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: {content_type}\r\n'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000):
+        """Запускает сервер и обрабатывает запросы до остановки
+
+        :param host: адрес
+        :param port: порт
+        """
+
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f'Сервис статистики: http://{host}:{server.sockets[0].getsockname()[1]}/statistics?profession=...')
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    """Точка входа сервиса: загружает файл и обрабатывает запросы
+
+    :param argv: список аргументов без имени программы, по умолчанию sys.argv[1:]
+    """
+
+    parser = argparse.ArgumentParser(description='HTTP сервис статистики вакансий')
+    parser.add_argument('file', nargs='?', default='vacancies_by_year.csv', help='csv файл с вакансиями')
+    parser.add_argument('--host', default='127.0.0.1', help='адрес (по умолчанию 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='порт (по умолчанию 8000)')
+    parser.add_argument('--no-cache', action='store_true', help='не использовать кэш разобранных данных')
+    parser.add_argument('--buffer-size', type=int, default=READ_BUFFER, help='размер буфера чтения файла в байтах')
+    parser.add_argument('--rates', help='csv файл с курсами валют по месяцам: столбец date (YYYY-MM) и столбцы валют')
+    parser.add_argument('--cache-size', type=int, default=256, help='количество записей в кэше статистики')
+    parser.add_argument('--artifacts-cache-size', type=int, default=64, help='количество отчётов в кэше')
+    parser.add_argument('--render-workers', type=int, help='количество процессов для построения отчётов')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    columns = VacancyColumns.from_file(args.file, not args.no_cache, buffer_size=args.buffer_size)
+    rates = None if args.rates is None else ExchangeRates.from_csv(args.rates)
+    service = StatisticsService(columns, rates, args.cache_size, args.artifacts_cache_size, args.render_workers)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+class ServiceTests(IsolatedAsyncioTestCase):
+    """Этот класс тестирует HTTP сервис статистики
+    """
+    async def asyncSetUp(self):
+        from program import write_test_vacancies
+
+        self.directory = tempfile.mkdtemp()
+        self.columns = VacancyColumns.from_file(write_test_vacancies(os.path.join(self.directory, 'vacancies.csv')),
+                                                use_cache=False)
+        self.service = StatisticsService(self.columns, render_workers=1)
+        self.server = await asyncio.start_server(self.service.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+    async def request(self, target):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        response = await reader.read()
+        writer.close()
+        head, body = response.split(b'\r\n\r\n', 1)
+        return int(head.split(b' ')[1]), body
+
+    async def test_statistics(self):
+        status, body = await self.request('/statistics?profession=%D0%9F%D1%80%D0%BE%D0%B3%D1%80%D0%B0%D0%BC%D0%BC'
+                                          '%D0%B8%D1%81%D1%82%201')
+        self.assertEqual(status, 200)
+        statics_by_years, statics_by_cities = self.columns.statistics('Программист 1')
+        self.assertEqual(json.loads(body)['by_years'], statics_by_years)
+        self.assertEqual(len(self.service.statistics_cache.entries), 1)
+
+    async def test_errors(self):
+        self.assertEqual((await self.request('/statistics?period=week'))[0], 400)
+        self.assertEqual((await self.request('/unknown'))[0], 404)
+
+    async def test_report(self):
+        status, body = await self.request('/report.xlsx?profession=1')
+        self.assertEqual((status, body[:2]), (200, b'PK'))
+        self.assertEqual(await self.request('/report.xlsx?profession=1'), (status, body))
+        self.assertEqual(len(self.service.artifacts_cache.entries), 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+
+CACHE_DIR_NAME = '.vacancy_cache'
+CACHE_SIZE = 2 * 1024 ** 3
+CACHE_VERSION = 6
+
+
+def cache_dir_for(file_name):
+    """Функция возвращает папку кэша по умолчанию, она лежит рядом с csv файлом
+
+    :param file_name: Имя csv файла с данными
+    :return: путь к папке кэша
+    """
+
+    return os.path.join(os.path.dirname(os.path.abspath(file_name)), CACHE_DIR_NAME)
+
+
+def content_hash(file_name, block_size=1024 * 1024):
+    """Функция считает хэш содержимого файла, читая его блоками
+
+    :param file_name: Имя файла
+    :param block_size: размер блока в байтах
+    :return: строка с шестнадцатеричным хэшем
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_name, 'rb') as r_file:
+        for block in iter(lambda: r_file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pack_strings(strings):
+    """Функция упаковывает список строк для сохранения в кэш: строки в кодировке utf-8 лежат подряд
+        в одном массиве байт, границы строк - в массиве смещений, поэтому длинная строка не увеличивает остальные
+
+    :param strings: список строк
+    :return: кортеж (массив байт np.uint8, массив смещений np.int64 длиной len(strings) + 1)
+
+    >>> pack_strings(['Пермь', '', 'Moscow'])[1]
+    array([ 0, 10, 10, 16])
+    """
+
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(data, offsets):
+    """Функция восстанавливает список строк, упакованный в pack_strings
+
+    :param data: массив байт
+    :param offsets: массив смещений
+    :return: список строк
+
+    >>> unpack_strings(*pack_strings(['Пермь', '', 'Moscow']))
+    ['Пермь', '', 'Moscow']
+    """
+
+    raw, bounds = data.tobytes(), offsets.tolist()
+    return [raw[start:end].decode('utf-8') for start, end in zip(bounds, bounds[1:])]
+
+
+def read_index(cache_dir):
+    """Функция читает индекс кэша, при отсутствии или несовпадении версии возвращает пустой индекс
+
+    :param cache_dir: папка кэша
+    :return: словарь {хэш содержимого: описание записи}
+    """
+
+    try:
+        with open(os.path.join(cache_dir, 'index.json'), encoding='utf-8') as r_file:
+            index = json.load(r_file)
+    except (OSError, ValueError):
+        return {}
+    if index.get('version') != CACHE_VERSION:
+        return {}
+    return index['entries']
+
+
+def write_index(cache_dir, entries):
+    """Функция атомарно записывает индекс кэша
+
+    :param cache_dir: папка кэша
+    :param entries: словарь {хэш содержимого: описание записи}
+    """
+
+    fd, temp_name = tempfile.mkstemp(dir=cache_dir, suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as w_file:
+        json.dump({'version': CACHE_VERSION, 'entries': entries}, w_file)
+    os.replace(temp_name, os.path.join(cache_dir, 'index.json'))
+
+
+def load_arrays(entry_dir):
+    """Функция отображает в память все массивы записи кэша
+
+    :param entry_dir: папка записи
+    :return: словарь {имя массива: np.ndarray только для чтения}
+    """
+
+    return {file_name[:-len('.npy')]: np.load(os.path.join(entry_dir, file_name), mmap_mode='r')
+            for file_name in os.listdir(entry_dir) if file_name.endswith('.npy')}
+
+
+def evict(cache_dir, entries, max_size, keep):
+    """Функция удаляет давно не использованные записи, пока общий размер кэша больше max_size
+
+    :param cache_dir: папка кэша
+    :param entries: словарь {хэш содержимого: описание записи}, будет изменён
+    :param max_size: допустимый размер кэша в байтах
+    :param keep: хэш записи, которую нельзя удалять
+    """
+
+    for digest in sorted(entries, key=lambda digest: entries[digest]['used']):
+        if sum(entry['bytes'] for entry in entries.values()) <= max_size:
+            break
+        if digest == keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, digest), ignore_errors=True)
+        entries.pop(digest)
+
+
+@contextmanager
+def locked(cache_dir):
+    """Контекстный менеджер, блокирующий индекс кэша для других процессов через flock на файле index.lock.
+        Без модуля fcntl блокировка не выполняется
+
+    :param cache_dir: папка кэша
+    """
+
+    with open(os.path.join(cache_dir, 'index.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def find_entry(cache_dir, entries, file_name, stat, digest=None):
+    """Функция ищет запись кэша по пути, размеру и времени изменения файла или по хэшу содержимого
+
+    :param cache_dir: папка кэша
+    :param entries: словарь {хэш содержимого: описание записи}
+    :param file_name: Имя csv файла с данными
+    :param stat: os.stat_result файла
+    :param digest: хэш содержимого, если уже посчитан
+    :return: хэш найденной записи или None
+    """
+
+    path = os.path.abspath(file_name)
+    if digest is None:
+        return next((digest for digest, entry in entries.items()
+                     if entry['path'] == path and entry['size'] == stat.st_size
+                     and entry['mtime_ns'] == stat.st_mtime_ns and os.path.isdir(os.path.join(cache_dir, digest))),
+                    None)
+    return digest if entries.__contains__(digest) and os.path.isdir(os.path.join(cache_dir, digest)) else None
+
+
+def touch(cache_dir, entries, digest, file_name, stat, max_size):
+    """Функция отмечает использование записи, вытесняет старые записи и сохраняет индекс.
+        Вызывается под блокировкой locked
+
+    :param cache_dir: папка кэша
+    :param entries: словарь {хэш содержимого: описание записи}, будет изменён
+    :param digest: хэш использованной записи
+    :param file_name: Имя csv файла с данными
+    :param stat: os.stat_result файла
+    :param max_size: допустимый размер кэша в байтах
+    """
+
+    entries[digest].update({'path': os.path.abspath(file_name), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                            'used': time.time()})
+    evict(cache_dir, entries, max_size, digest)
+    write_index(cache_dir, entries)
+
+
+def cached_arrays(file_name, build, cache_dir=None, max_size=CACHE_SIZE):
+    """Функция возвращает разобранные данные файла из кэша, а при промахе строит их и сохраняет в кэш.
+
+    Запись ищется сначала по пути, размеру и времени изменения файла, затем по хэшу содержимого,
+    поэтому скопированный или заново выгруженный без изменений файл тоже попадает в кэш.
+    Изменённый файл получает новый хэш, старая запись со временем вытесняется.
+    Индекс читается и изменяется под блокировкой, поэтому кэшем могут одновременно пользоваться
+    несколько процессов; разбор файла и хэширование выполняются без блокировки.
+    Если кэш недоступен, например папка только для чтения, данные просто строятся заново.
+
+    :param file_name: Имя csv файла с данными
+    :param build: функция без аргументов, возвращающая словарь {имя массива: np.ndarray}
+    :param cache_dir: папка кэша, по умолчанию cache_dir_for(file_name)
+    :param max_size: допустимый размер кэша в байтах
+    :return: словарь {имя массива: np.ndarray}
+    """
+
+    cache_dir = cache_dir_for(file_name) if cache_dir is None else cache_dir
+    stat = os.stat(file_name)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with locked(cache_dir):
+            entries = read_index(cache_dir)
+            digest = find_entry(cache_dir, entries, file_name, stat)
+            if digest is not None:
+                arrays = load_arrays(os.path.join(cache_dir, digest))
+                touch(cache_dir, entries, digest, file_name, stat, max_size)
+                return arrays
+        digest = content_hash(file_name)
+        with locked(cache_dir):
+            entries = read_index(cache_dir)
+            if find_entry(cache_dir, entries, file_name, stat, digest) is not None:
+                arrays = load_arrays(os.path.join(cache_dir, digest))
+                touch(cache_dir, entries, digest, file_name, stat, max_size)
+                return arrays
+    except OSError:
+        return build()
+
+    arrays = build()
+    try:
+        temp_dir = tempfile.mkdtemp(dir=cache_dir)
+        try:
+            for key, value in arrays.items():
+                np.save(os.path.join(temp_dir, key + '.npy'), value, allow_pickle=False)
+            with locked(cache_dir):
+                entries = read_index(cache_dir)
+                entry_dir = os.path.join(cache_dir, digest)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(temp_dir, entry_dir)
+                path = os.path.abspath(file_name)
+                for stale in [stale for stale, entry in entries.items() if entry['path'] == path and stale != digest]:
+                    shutil.rmtree(os.path.join(cache_dir, stale), ignore_errors=True)
+                    entries.pop(stale)
+                entries.update({digest: {'bytes': sum(value.nbytes for value in arrays.values())}})
+                touch(cache_dir, entries, digest, file_name, stat, max_size)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    except OSError:
+        pass
+    return arrays